@@ -1,4 +1,9 @@
+import json
+import re
+
 from maya import cmds
+# OpenMaya API 2.0, it works on node handles instead of name strings
+from maya.api import OpenMaya as om
 
 SUFFIXES = {
     "mesh": "geo",
@@ -8,48 +13,728 @@ SUFFIXES = {
 DEFAULT_SUFFIX = "grp"
 
 
-def renamer(selection=False):
+# the conditions a rule can have, any condition left out matches everything
+CONDITIONS = ("type", "parentType", "namespace", "name")
+
+
+class RuleTable(object):
     """
-    Rename the objects with suffix corresponding to their type
+    This is a table of suffix rules, checked in order, the first rule which matches gives the suffix.
+    A rule is a dict with a "suffix" and any of the CONDITIONS:
+        type: the node type, or the type of its only child, like "mesh"
+        parentType: the type of the parent node
+        namespace: the namespace of the node, "" for none
+        name: a regex searched in the short name without namespace
+
+    The rules are sorted by type once, so a node only looks at the rules for its own type.
+    The answer for a (type, parentType, namespace) is remembered when no name regex was needed,
+    so a scene with 100k nodes of a few kinds costs about one dict lookup per node.
+    """
+
+    def __init__(self, rules=None, default=DEFAULT_SUFFIX):
+        self.default = default
+        self.rules = []
+        self.byType = {}
+        self.anyType = []
+        self.candidates = {}
+        self.memo = {}
+
+        for order, rule in enumerate(rules or []):
+            unknown = set(rule) - set(CONDITIONS) - {"suffix"}
+            if unknown or "suffix" not in rule:
+                raise ValueError("Rule %s should have a suffix and only %s!" % (order, ", ".join(CONDITIONS)))
+
+            compiled = dict(rule)
+            compiled["order"] = order
+            if rule.get("name") is not None:
+                compiled["name"] = re.compile(rule["name"])
+
+            self.rules.append(compiled)
+            if rule.get("type") is None:
+                self.anyType.append(compiled)
+            else:
+                self.byType.setdefault(rule["type"], []).append(compiled)
+
+        # the parent type is only looked up when a rule needs it
+        self.needsParent = any(rule.get("parentType") is not None for rule in self.rules)
+
+    @classmethod
+    def fromSuffixes(cls, suffixes=SUFFIXES, default=DEFAULT_SUFFIX):
+        """
+        Build a table from a dict of {node type: suffix}, like SUFFIXES
+        """
+        return cls([{"type": objtype, "suffix": suffix} for objtype, suffix in suffixes.items()], default)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a table from a json file like {"default": "grp", "rules": [{"type": "mesh", "suffix": "geo"}, ...]}
+        """
+        with open(path) as f:
+            data = json.load(f)
+
+        return cls(data.get("rules", []), data.get("default", DEFAULT_SUFFIX))
+
+    def _candidatesFor(self, objtype):
+        # the rules for this type and the rules for any type, still in the order of the file
+        candidates = self.candidates.get(objtype)
+        if candidates is None:
+            candidates = sorted(self.byType.get(objtype, []) + self.anyType, key=lambda rule: rule["order"])
+            self.candidates[objtype] = candidates
+        return candidates
+
+    def classify(self, objtype, parentType=None, namespace="", name=""):
+        """
+        Get the suffix for a node
+
+        Args:
+            objtype: the node type, or the type of its only child
+            parentType: the type of the parent node
+            namespace: the namespace of the node
+            name: the short name of the node without namespace
+
+        Returns:
+            the suffix, or None when this node should not get one
+
+        """
+        key = (objtype, parentType, namespace)
+        if key in self.memo:
+            return self.memo[key]
+
+        usedName = False
+        suffix = self.default
+
+        for rule in self._candidatesFor(objtype):
+            if rule.get("parentType") is not None and rule["parentType"] != parentType:
+                continue
+            if rule.get("namespace") is not None and rule["namespace"] != namespace:
+                continue
+            if rule.get("name") is not None:
+                usedName = True
+                if not rule["name"].search(name):
+                    continue
+
+            suffix = rule["suffix"]
+            break
+
+        # only remember it when the name did not matter
+        if not usedName:
+            self.memo[key] = suffix
+
+        return suffix
+
+
+DEFAULT_RULES = RuleTable.fromSuffixes()
+
+
+def getRuleTable(rules=None):
+    """
+    Get a RuleTable from a table, a json file path, or None for the default SUFFIXES
+    """
+    if rules is None:
+        return DEFAULT_RULES
+    if isinstance(rules, RuleTable):
+        return rules
+    return RuleTable.load(rules)
+
+
+def splitNamespace(shortname):
+    """
+    Split "char:body_geo" into ("char", "body_geo")
+    """
+    namespace, _, name = shortname.rpartition(':')
+    return namespace, name
+
+
+class NameIndex(object):
+    """
+    This is an index of every short name in the scene, sorted by namespace.
+    It is built from one cmds.ls() call, then a planned name is checked against it with a dict lookup
+    instead of one cmds.objExists for each candidate.
+    A taken name gets the lowest free number added, like body_geo1, body_geo2, so the result is always the same.
+    """
+
+    def __init__(self, names=None):
+        # {namespace: {name: how many nodes have it}}, DAG nodes under different parents can share a short name
+        self.namespaces = {}
+        for name in names or []:
+            self.add(name)
+
+    @classmethod
+    def fromScene(cls):
+        return cls(cmds.ls())
+
+    def _split(self, name):
+        # ls() gives a path like "a|b" when the short name is not unique
+        return splitNamespace(name.split('|')[-1])
+
+    def add(self, name):
+        namespace, name = self._split(name)
+        names = self.namespaces.setdefault(namespace, {})
+        names[name] = names.get(name, 0) + 1
+
+    def remove(self, name):
+        namespace, name = self._split(name)
+        names = self.namespaces.get(namespace, {})
+        if names.get(name, 0) > 1:
+            names[name] -= 1
+        else:
+            names.pop(name, None)
+
+    def taken(self, name):
+        namespace, name = self._split(name)
+        return name in self.namespaces.get(namespace, {})
+
+    def claim(self, oldName, newName):
+        """
+        Get a free name for a node which is renamed from oldName to newName, and update the index
+
+        Args:
+            oldName: the current short name of the node, it is free again after the rename
+            newName: the wanted short name, with its namespace
+
+        Returns:
+            newName, or newName with the lowest number which makes it free
+
+        """
+        name = newName
+        count = 0
+        while self.taken(name):
+            count += 1
+            name = "%s%s" % (newName, count)
+
+        self.remove(oldName)
+        self.add(name)
+        return name
+
+
+def inNamespaces(shortname, namespaces=None):
+    """
+    Check if a node is in one of the namespaces, or in a namespace under them.
+    "char" takes "char:body_geo" and "char:eyes:left_geo", "" or ":" only takes the root namespace
+
+    Args:
+        shortname: the short name of the node
+        namespaces: a list of namespaces. Default to take every node
+
+    Returns:
+        bool
+
+    """
+    if namespaces is None:
+        return True
+
+    namespace = splitNamespace(shortname)[0].strip(':')
+    for include in namespaces:
+        include = include.strip(':')
+        if namespace == include or (include and namespace.startswith(include + ':')):
+            return True
+
+    return False
+
+
+def listLockedNodes(selection=False):
+    """
+    Get the DAG nodes cmds.rename would fail on: the referenced, locked and default nodes
 
     Args:
         selection: Whether we use the objects selected or not
 
     Returns:
-        The object List with new name
+        a set of long names
+
+    """
+    locked = set()
+
+    # ls can only list the nodes which have a flag, not the ones without, and two flags only give the nodes with both.
+    # so this is one query for each kind over the whole hierarchy, instead of one check for each node
+    for flag in ('referencedNodes', 'lockedNodes', 'defaultNodes'):
+        locked.update(cmds.ls(selection=selection, long=True, dag=True, **{flag: True}) or [])
+
+    return locked
+
+
+def canRename(path, namespaces=None):
+    """
+    The OpenMaya version of listLockedNodes() and inNamespaces() for a single node,
+    it only reads flags the node already has, without any cmds call
+
+    Args:
+        path: the om.MDagPath of the node
+        namespaces: a list of namespaces to take. Default to every namespace
+
+    Returns:
+        bool
 
     """
-    objects = cmds.ls(selection=selection, long=True, dag=True)
+    node = om.MFnDependencyNode(path.node())
+
+    if node.isFromReferencedFile or node.isLocked or node.isDefaultNode:
+        return False
+
+    return inNamespaces(node.name(), namespaces)
+
+
+def hasSuffix(shortname, suffix):
+    """
+    Whether the name already ends with the suffix, or with the suffix and a number given by NameIndex
+    """
+    return re.search(r'_%s\d*$' % re.escape(suffix), shortname) is not None
+
+
+def buildLookup(pairs):
+    """
+    Build the lookup tables of the DAG nodes from the result of cmds.ls(showType=True)
+
+    Args:
+        pairs: a flat list like [name, type, name, type ...] with long names
 
-    if selection and not objects:
+    Returns:
+        (objects, types, hierarchy)
+        objects is the list of long names,
+        types is a dict of {long name: node type},
+        hierarchy is a dict of {long name: [long names of its children]}
+
+    """
+    objects = pairs[::2]
+    types = dict(zip(objects, pairs[1::2]))
+    hierarchy = {}
+
+    # ls(dag=True) already lists every descendant, so the parent of each node is in the table as well
+    # and can be read from its long name, without asking Maya with listRelatives
+    for obj in objects:
+        parent = obj.rpartition('|')[0]
+        if parent in types:
+            hierarchy.setdefault(parent, []).append(obj)
+
+    return objects, types, hierarchy
+
+
+def rebuildLongNames(objects, shortnames):
+    """
+    Work out the current long name of every node from the parent pointers of their original long names
+
+    Args:
+        objects: the original long names
+        shortnames: a dict of {original long name: current short name} for the renamed nodes
+
+    Returns:
+        a dict of {original long name: current long name}
+
+    """
+    # the world ('') is never renamed. A node which is not in shortnames keeps its short name,
+    # but its parents could still have been renamed, so the climb always goes up to the world
+    names = {'': ''}
+
+    for obj in objects:
+        # climb up until a node whose name is already worked out, then come back down.
+        # every node is only worked out once, so the whole hierarchy costs one pass
+        chain = []
+        node = obj
+        while node not in names:
+            chain.append(node)
+            node = node.rpartition('|')[0]
+
+        for node in reversed(chain):
+            parent = node.rpartition('|')[0]
+            names[node] = '%s|%s' % (names[parent], shortnames.get(node, node.rpartition('|')[2]))
+
+    return names
+
+
+def planRenames(selection=False, rules=None, namespaces=None):
+    """
+    Work out the new name of every object, without touching the scene
+
+    Args:
+        selection: Whether we use the objects selected or not
+        rules: a RuleTable or the path of a json rule file. Default to SUFFIXES
+        namespaces: only rename the objects in these namespaces. Default to every namespace
+
+    Returns:
+        (objects, plan)
+        objects is the list of every long name, the longest first,
+        plan is a list of (long name, new short name) in the order they should be renamed
+
+    """
+    # one query gives the names and the types of the whole hierarchy,
+    # instead of one listRelatives and one objectType for each node.
+    # allPaths lists an instanced shape under every parent, so each instance transform sees its child
+    pairs = cmds.ls(selection=selection, long=True, dag=True, showType=True, allPaths=True)
+
+    if selection and not pairs:
         raise RuntimeError("There is no object selected.")
 
+    paths, types, hierarchy = buildLookup(pairs)
+
+    # but an instanced node is still one node, it is renamed once, through the one path ls gives without allPaths
+    objects = cmds.ls(selection=selection, long=True, dag=True) or []
+    objects.sort(key=len, reverse=True)
+
+    # referenced, locked and default nodes can not be renamed, drop them before any work is done on them.
+    # objects, types and hierarchy keep every node: a shape in a reference still tells the type of a local transform,
+    # and a locked node between two renamed ones is still needed to work out their new long names
+    locked = listLockedNodes(selection=selection)
+    renamable = [obj for obj in objects if obj not in locked and inNamespaces(obj.split('|')[-1], namespaces)]
+
+    table = getRuleTable(rules)
+
+    if table.needsParent:
+        # the parents of the selected roots are not in the table yet, get all of them in one query
+        outside = set(obj.rpartition('|')[0] for obj in renamable) - set(types) - {''}
+        if outside:
+            extra = cmds.ls(list(outside), long=True, showType=True) or []
+            types.update(zip(extra[::2], extra[1::2]))
+
+    # every name in the scene, so the new names never clash and Maya never has to number them itself
+    index = NameIndex.fromScene()
+
+    plan = []
+
+    # the table is keyed by the names before renaming. The longest names go first,
+    # so a node is always renamed before its parents and its own long name is still valid
+    for obj in renamable:
+        shortname = obj.split('|')[-1]
+        children = hierarchy.get(obj, [])
+
+        if len(children) == 1:
+            child = children[0]
+            objtype = types[child]
+        else:
+            objtype = types[obj]
+
+        namespace, name = splitNamespace(shortname)
+        suffix = table.classify(objtype, types.get(obj.rpartition('|')[0]), namespace, name)
+
+        if not suffix:
+            continue
+
+        if hasSuffix(shortname, suffix):
+            continue
+
+        plan.append((obj, index.claim(shortname, "%s_%s" % (shortname, suffix))))
+
+    return objects, plan
+
+
+def applyPlan(plan, objects=None):
+    """
+    Rename the objects of a plan, all in one undo chunk and with the viewport refresh suspended,
+    so the whole batch is fast and one ctrl+z undoes all of it
+
+    Args:
+        plan: a list of (long name, new short name) from planRenames()
+        objects: the long names to give back with their new names. Default to the objects of the plan
+
+    Returns:
+        The object List with new name
+
+    """
+    if objects is None:
+        objects = [obj for obj, new_name in plan]
+
+    # {original long name: new short name}, the long names are only rebuilt once at the end
+    shortnames = {}
+
+    cmds.undoInfo(openChunk=True, chunkName="ObjectRenamer")
+    cmds.refresh(suspend=True)
+
+    try:
+        for obj, new_name in plan:
+            # every shape is renamed by this loop itself, so Maya should not rename it again with its transform.
+            # rename gives back the name really used, Maya adds a number when the name is taken
+            new_name = cmds.rename(obj, new_name, ignoreShape=True)
+            shortnames[obj] = new_name.split('|')[-1]
+    finally:
+        # always give the viewport and the undo queue back, even when a rename failed
+        cmds.refresh(suspend=False)
+        cmds.undoInfo(closeChunk=True)
+
+    names = rebuildLongNames(objects, shortnames)
+    return [names[obj] for obj in objects]
+
+
+def renamer(selection=False, rules=None, dryRun=False, namespaces=None):
+    """
+    Rename the objects with suffix corresponding to their type
+
+    Args:
+        selection: Whether we use the objects selected or not
+        rules: a RuleTable or the path of a json rule file. Default to SUFFIXES
+        namespaces: only rename the objects in these namespaces. Default to every namespace
+        dryRun: only work out the new names, without renaming anything
+
+    Returns:
+        The object List with new name, or the plan as a list of (long name, new short name) with dryRun
+
+    """
+    objects, plan = planRenames(selection=selection, rules=rules, namespaces=namespaces)
+
+    if dryRun:
+        return plan
+
+    return applyPlan(plan, objects)
+
+
+def listDagPaths(selection=False):
+    """
+    Get the DAG paths of the whole scene, or of the selected objects and everything under them
+
+    Args:
+        selection: Whether we use the objects selected or not
+
+    Returns:
+        a list of om.MDagPath, each node once, through the first path found to it
+
+    """
+    paths = []
+    seen = set()
+
+    if selection:
+        selected = om.MGlobal.getActiveSelectionList()
+        roots = []
+        for i in range(selected.length()):
+            try:
+                roots.append(selected.getDagPath(i))
+            except (RuntimeError, TypeError):
+                # not a DAG node, e.g. a material
+                continue
+
+        if not roots:
+            raise RuntimeError("There is no object selected.")
     else:
-        objects.sort(key=len, reverse=True)
+        roots = [None]
 
-        for obj in objects:
-            shortname = obj.split('|')[-1]
-            children = cmds.listRelatives(obj, children=True) or []
+    for root in roots:
+        # without a root the iterator starts from the world
+        iterator = om.MItDag()
+        if root is not None:
+            iterator.reset(root)
 
-            if len(children) == 1:
-                child = children[0]
-                objtype = cmds.objectType(child)
-            else:
-                objtype = cmds.objectType(obj)
+        while not iterator.isDone():
+            path = iterator.getPath()
+
+            # keyed by the node, not the path: an instance has one path for each parent,
+            # but it is only one node and must only be renamed once
+            key = om.MObjectHandle(path.node()).hashCode()
+
+            # the world node has no parent path, and a child of two selected objects is only listed once
+            if path.length() and key not in seen:
+                seen.add(key)
+                paths.append(path)
+
+            iterator.next()
 
-            suffix = SUFFIXES.get(object,DEFAULT_SUFFIX)
+    return paths
+
+
+def classifyPath(path, table):
+    """
+    Get the short name and the suffix of a node through OpenMaya
 
-            if not suffix:
+    Args:
+        path: the om.MDagPath of the node
+        table: the RuleTable to classify it with
+
+    Returns:
+        (short name, suffix), the suffix is None when this node should not get one
+
+    """
+    node = om.MFnDagNode(path)
+
+    if path.childCount() == 1:
+        objtype = om.MFnDependencyNode(path.child(0)).typeName
+    else:
+        objtype = node.typeName
+
+    parentType = None
+    if table.needsParent and node.parentCount():
+        parentType = om.MFnDependencyNode(node.parent(0)).typeName
+
+    shortname = node.name()
+    namespace, name = splitNamespace(shortname)
+
+    return shortname, table.classify(objtype, parentType, namespace, name)
+
+
+def renamerApi(selection=False, rules=None, namespaces=None):
+    """
+    Rename the objects with suffix corresponding to their type, through OpenMaya instead of cmds.
+    The nodes are held by MObjectHandle, so a renamed parent does not make any name stale,
+    and the whole batch is done by one MDagModifier with a single doIt().
+
+    Args:
+        selection: Whether we use the objects selected or not
+        rules: a RuleTable or the path of a json rule file. Default to SUFFIXES
+        namespaces: only rename the objects in these namespaces. Default to every namespace
+
+    Returns:
+        (the object List with new name, the MDagModifier).
+        Maya only puts API changes in its undo queue when they come from a plugin command,
+        so call modifier.undoIt() to revert the whole batch in one step.
+
+    """
+    paths = [path for path in listDagPaths(selection=selection) if canRename(path, namespaces)]
+    modifier = om.MDagModifier()
+    table = getRuleTable(rules)
+    index = NameIndex.fromScene()
+
+    for path in paths:
+        shortname, suffix = classifyPath(path, table)
+
+        if not suffix:
+            continue
+
+        if hasSuffix(shortname, suffix):
+            continue
+
+        handle = om.MObjectHandle(path.node())
+        if handle.isValid():
+            modifier.renameNode(handle.object(), index.claim(shortname, "%s_%s" % (shortname, suffix)))
+
+    modifier.doIt()
+
+    # a MDagPath follows its node, so the new long names can be read straight from them
+    return [path.fullPathName() for path in paths], modifier
+
+
+class SuffixWatcher(object):
+    """
+    This keeps new DAG nodes suffixed while we work, instead of running renamer() over the whole scene again and again.
+    A node added callback only queues the new nodes, and they are renamed together the next time Maya is idle,
+    so the cost only depends on how many nodes were added.
+    The name index is kept up to date by the node removed and name changed callbacks,
+    and it is only built again from the whole scene when a scene is opened, imported or made new.
+
+    watcher = SuffixWatcher()
+    watcher.start()
+    ...
+    watcher.stop()
+    """
+
+    # the scene messages after which the index is built again, the nodes they add are not queued
+    SCENE_MESSAGES = ("kAfterNew", "kAfterOpen", "kAfterImport", "kAfterCreateReference", "kAfterLoadReference")
+
+    def __init__(self, rules=None, namespaces=None):
+        self.table = getRuleTable(rules)
+        self.namespaces = namespaces
+        self.callbackIds = []
+        self.pending = []
+        # the hash codes of the pending nodes, they only go in the index when they are flushed
+        self.pendingHashes = set()
+        self.scheduled = False
+        self.renaming = False
+        self.index = None
+
+    def start(self):
+        if self.callbackIds:
+            return
+
+        # built once, then kept up to date by the callbacks
+        self.index = NameIndex.fromScene()
+
+        self.callbackIds = [
+            om.MDGMessage.addNodeAddedCallback(self._nodeAdded, "dagNode"),
+            om.MDGMessage.addNodeRemovedCallback(self._nodeRemoved, "dependNode"),
+            # a null node means every node in the scene
+            om.MNodeMessage.addNameChangedCallback(om.MObject.kNullObj, self._nameChanged),
+        ]
+
+        for message in self.SCENE_MESSAGES:
+            self.callbackIds.append(om.MSceneMessage.addCallback(getattr(om.MSceneMessage, message), self._rebuild))
+
+    def stop(self):
+        if not self.callbackIds:
+            return
+
+        om.MMessage.removeCallbacks(self.callbackIds)
+        self.callbackIds = []
+        self.pending = []
+        self.pendingHashes = set()
+        self.index = None
+
+    def _nodeAdded(self, node, clientData=None):
+        # the nodes of a file being opened or imported are not new work, the index is built again after it
+        if om.MFileIO.isReadingFile():
+            return
+
+        # the node is not named or parented yet when the callback runs, only remember it
+        handle = om.MObjectHandle(node)
+        self.pending.append(handle)
+        self.pendingHashes.add(handle.hashCode())
+
+        if not self.scheduled:
+            self.scheduled = True
+            cmds.evalDeferred(self.flush, lowestPriority=True)
+
+    def _nodeRemoved(self, node, clientData=None):
+        if self.index is None or om.MObjectHandle(node).hashCode() in self.pendingHashes:
+            return
+
+        self.index.remove(om.MFnDependencyNode(node).name())
+
+    def _nameChanged(self, node, previousName, clientData=None):
+        # the names given by flush() are already in the index through claim(),
+        # and a pending node is added with whatever name it has when it is flushed
+        if self.index is None or self.renaming or om.MFileIO.isReadingFile():
+            return
+
+        if om.MObjectHandle(node).hashCode() in self.pendingHashes:
+            return
+
+        if previousName:
+            self.index.remove(previousName)
+        self.index.add(om.MFnDependencyNode(node).name())
+
+    def _rebuild(self, clientData=None):
+        self.pending = []
+        self.pendingHashes = set()
+        self.index = NameIndex.fromScene()
+
+    def flush(self):
+        """
+        Suffix every node queued since the last flush. It is called on idle, but can also be called by hand.
+
+        Returns:
+            The object List with new name
+
+        """
+        self.scheduled = False
+        handles, self.pending = self.pending, []
+        self.pendingHashes = set()
+
+        if self.index is None:
+            return []
+
+        paths = {}
+        for handle in handles:
+            # the node could have been deleted or undone in the meantime
+            if not handle.isValid() or not handle.isAlive():
                 continue
 
-            if obj.endswith('_' + suffix):
+            path = om.MFnDagNode(handle.object()).getPath()
+
+            # a skipped node keeps its name, but the name is taken all the same
+            self.index.add(path.partialPathName())
+            if canRename(path, self.namespaces):
+                paths[path.fullPathName()] = path
+
+        plan = []
+
+        # the deepest first, like planRenames(), so each long name is still valid when it is renamed
+        for obj in sorted(paths, key=len, reverse=True):
+            shortname, suffix = classifyPath(paths[obj], self.table)
+
+            if not suffix or hasSuffix(shortname, suffix):
                 continue
 
-            else:
-                new_name = "%s_%s" % (shortname, suffix)
-                cmds.rename(obj, new_name)
+            plan.append((obj, self.index.claim(shortname, "%s_%s" % (shortname, suffix))))
 
-                index = objects.index(obj)
-                objects[index] = obj.replace(shortname, new_name)
+        if not plan:
+            return []
 
-    return objects
+        self.renaming = True
+        try:
+            return applyPlan(plan)
+        finally:
+            self.renaming = False
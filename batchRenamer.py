@@ -0,0 +1,175 @@
+# a command line driver which runs ObjectRenamer over many scene files without opening Maya by hand
+# it must be run with mayapy, e.g.
+# mayapy batchRenamer.py assets/*.ma --jobs 8 --report report.json
+
+# a library for passing command line arguments
+import argparse
+
+import json
+
+# a pool of worker processes, each one with its own headless Maya, so the files are renamed side by side
+import multiprocessing
+
+import os
+
+import sys
+
+import time
+
+# the scene types cmds.file needs to save a file with the same format it was opened with
+SCENE_TYPES = {
+    '.ma': 'mayaAscii',
+    '.mb': 'mayaBinary',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="This renames the objects of many Maya scenes with ObjectRenamer",
+                                     usage="mayapy batchRenamer.py assets/*.ma --jobs 8 --report report.json")
+    parser.add_argument('files', nargs='*', help="The .ma and .mb files to rename")
+    parser.add_argument('--from-file', dest='fromFile',
+                        help="A text file with one scene path on each line, for lists too long for the shell")
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+                        help="How many Maya processes to run at the same time. Default to the number of cores")
+    parser.add_argument('--max-files', dest='maxFiles', type=int, default=50,
+                        help="How many files a process renames before it is replaced with a fresh one, "
+                             "which keeps the memory Maya leaks from piling up")
+    parser.add_argument('-r', '--rules', help="A json rule file for ObjectRenamer. Default to its SUFFIXES")
+    parser.add_argument('--namespace', dest='namespaces', action='append',
+                        help="Only rename the objects in this namespace, can be given many times. Default to all of them")
+    parser.add_argument('-n', '--dry-run', dest='dryRun', action='store_true',
+                        help="Only report the new names, without saving anything")
+    parser.add_argument('--report', help="The json file to write the report of every file to")
+
+    args = parser.parse_args()
+
+    files = list(args.files)
+    if args.fromFile:
+        with open(args.fromFile) as f:
+            files.extend(line.strip() for line in f if line.strip())
+
+    if not files:
+        parser.error("No scene file was given")
+
+    reports = batchRename(files, jobs=args.jobs, rules=args.rules, dryRun=args.dryRun, maxFiles=args.maxFiles,
+                          namespaces=args.namespaces)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=4)
+
+    failures = [report for report in reports if report['error']]
+    print("%s files, %s objects renamed, %s failed" % (len(reports), sum(report['renamed'] for report in reports),
+                                                        len(failures)))
+
+    if failures:
+        sys.exit(1)
+
+
+def initializeWorker():
+    """
+    This runs once in each worker process. Starting Maya takes a few seconds, so it is not done again for every file.
+    """
+    import maya.standalone
+    maya.standalone.initialize(name='python')
+
+    # nobody will undo anything here, the undo queue would only cost time and memory
+    from maya import cmds
+    cmds.undoInfo(state=False)
+
+
+def renameScene(task):
+    """
+    This function will open a scene, rename its objects and save it. It runs inside a worker process.
+    Args:
+        task: (path, rules, dryRun, namespaces)
+
+    Returns:
+        a dict with the file, how many objects were renamed, the time taken and the error if it failed
+    """
+    path, rules, dryRun, namespaces = task
+    report = {'file': path, 'renamed': 0, 'seconds': 0.0, 'error': None}
+    start = time.time()
+
+    try:
+        # ObjectRenamer imports maya.cmds, which only works once Maya is initialized in this process
+        from maya import cmds
+        import ObjectRenamer
+
+        cmds.file(path, open=True, force=True)
+
+        objects, plan = ObjectRenamer.planRenames(rules=rules, namespaces=namespaces)
+        report['renamed'] = len(plan)
+
+        if plan and not dryRun:
+            ObjectRenamer.applyPlan(plan, objects)
+            cmds.file(save=True, force=True, type=SCENE_TYPES[os.path.splitext(path)[1].lower()])
+    except Exception as e:
+        # one broken scene should not stop the others, it is only reported
+        report['error'] = '%s: %s' % (type(e).__name__, e)
+
+    report['seconds'] = time.time() - start
+    return report
+
+
+def batchRename(files, jobs=None, rules=None, dryRun=False, maxFiles=50, namespaces=None):
+    """
+    This function will hand the scene files to a pool of headless Maya processes.
+    Args:
+        files: a list of .ma and .mb paths
+        jobs: how many processes to run. Default to the number of cores
+        rules: the path of a json rule file for ObjectRenamer
+        dryRun: only count the renames, without saving anything
+        maxFiles: how many files a process renames before it is replaced
+        namespaces: only rename the objects in these namespaces. Default to every namespace
+
+    Returns:
+        a list of dict, one report for each file, in the order of files. A file given twice is only renamed and reported once
+    """
+    reports = {}
+    tasks = []
+    queued = set()
+
+    # the rule file is read by every worker, so give them all the same absolute path
+    if rules:
+        rules = os.path.abspath(rules)
+
+    for path in files:
+        path = os.path.abspath(path)
+
+        # the same scene listed twice, e.g. by --from-file and a glob, must not be opened and saved by two workers
+        if path in reports or path in queued:
+            continue
+
+        if os.path.splitext(path)[1].lower() not in SCENE_TYPES:
+            reports[path] = {'file': path, 'renamed': 0, 'seconds': 0.0, 'error': "Not a .ma or .mb file"}
+        elif not os.path.isfile(path):
+            reports[path] = {'file': path, 'renamed': 0, 'seconds': 0.0, 'error': "No such file"}
+        else:
+            queued.add(path)
+            tasks.append((path, rules, dryRun, namespaces))
+
+    if tasks:
+        pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(), len(tasks)),
+                                    initializer=initializeWorker, maxtasksperchild=maxFiles)
+        try:
+            # the scenes are not the same size, so each worker takes the next file as soon as it is done
+            for report in pool.imap_unordered(renameScene, tasks):
+                reports[report['file']] = report
+                print("%s %s" % ('FAILED' if report['error'] else 'done', report['file']))
+        finally:
+            pool.close()
+            pool.join()
+
+    ordered = []
+    for path in files:
+        report = reports.pop(os.path.abspath(path), None)
+        if report:
+            ordered.append(report)
+
+    return ordered
+
+
+# the namespace is only equal to __main__ when running the scripts directly
+if __name__ == '__main__':
+    main()
@@ -1,84 +1,1894 @@
-# cli is short for command line interface
-
-# a library for passing command line arguments
-import argparse
-
-# a python module for interpreting Regular Express
-import re
-
-import os
-
-# an expansion for os, including delete, move, copy, compress or depress for files
-import shutil
-
-
-def main():
-    parser = argparse.ArgumentParser(description="This is a batch renamer",
-                                     usage="To replace all files with dell with goodbye instead: python cliRenamer.py hello goodbye")
-    parser.add_argument('inString', help="The word to replace")
-    parser.add_argument('outString', help="The word to replace it with")
-
-    # optional arguments usually start with a dash and they have a short form and a long form
-    # 'store_true' means if this arg is provided, while no value for it, then default to true
-    parser.add_argument('-d', '--duplicate',
-                        help="Whether to duplicate or replace in spot",
-                        action='store_true')
-
-    parser.add_argument('-r', '--regex',
-                        help="Whether the patterns are regex or not",
-                        action='store_true')
-    parser.add_argument('-o', '--output', help="The output location. Default to here")
-
-    args = parser.parse_args()
-    print args
-
-    rename(args.inString, args.outString, duplicate=args.duplicate, outDirectory=args.output, regex=args.regex)
-
-
-def rename(inString, outString, duplicate=True, inDirectory=None, outDirectory=None, regex=False):
-
-    if not inDirectory:
-
-        # getcwd means get current working directory
-        inDirectory = os.getcwd()
-    if not outDirectory:
-        outDirectory = inDirectory
-
-    print outDirectory
-
-    outDirectory = os.path.abspath(outDirectory)
-
-    if not os.path.exists(outDirectory):
-        raise IOError("%s does not exist!" % outDirectory)
-
-    if not os.path.exists(inDirectory):
-        raise IOError("%s does not exist!" % inDirectory)
-
-    for f in os.listdir(inDirectory):
-        # startswith('.') means it is a hidden file and should not be touched.
-        if f.startswith('.'):
-            continue
-
-        # use regex replace or not
-        # so we can use "[tT]orus" or "^sphere" to make the condition more specific
-        if regex:
-            name = re.sub(inString, outString, f)
-        else:
-            name = f.replace(inString, outString)
-
-        # if nothing happened, then continue
-        if name == f:
-            continue
-
-        src = os.path.join(inDirectory, f)
-        dest = os.path.join(outDirectory, name)
-
-        if duplicate:
-            shutil.copy2(src, dest)
-        else:
-            os.rename(src, dest)
-
-
-# the namespace is only equal to __main__ when running the scripts directly
-if __name__ == '__main__':
-    main()
+# cli is short for command line interface
+
+# a library for passing command line arguments
+import argparse
+
+# an event loop which keeps many slow filesystem calls waiting at the same time
+import asyncio
+
+import errno
+
+# turns shell style patterns like *.exr into regex
+import fnmatch
+
+import hashlib
+
+import json
+
+# mmap lets the hash read a file straight from the page cache, without copying it into python strings first
+import mmap
+
+# a python module for interpreting Regular Express
+import re
+
+import os
+
+# an expansion for os, including delete, move, copy, compress or depress for files
+import shutil
+
+import sys
+
+# a light weight class with named fields, for the planned operations
+from collections import namedtuple
+
+# fcntl only exists on unix, it is used to ask the filesystem for a reflink
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import threading
+
+import time
+
+# a pool of worker threads, the copies spend most of their time waiting on the disk or the network, not the CPU
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+# hard: a new name for the same data, reflink: a copy which shares the data blocks until one of them is changed,
+# copy: a real copy, done by the kernel when possible
+LINK_MODES = ('hard', 'reflink', 'copy')
+
+# the ioctl request number of FICLONE from linux/fs.h
+FICLONE = 0x40049409
+
+# the errors which mean "this filesystem can not do it", so we should try the next way instead of failing
+UNSUPPORTED_ERRORS = set(getattr(errno, name) for name in
+                         ('EXDEV', 'EPERM', 'EMLINK', 'ENOSYS', 'EINVAL', 'ENOTTY', 'EOPNOTSUPP', 'ENOTSUP',
+                          'ENOTSOCK', 'EBADF')
+                         if hasattr(errno, name))
+
+# the size of each piece when we have to copy the bytes ourselves
+CHUNK_SIZE = 1024 * 1024
+
+# a frame of an image sequence, like "shot010_beauty." + "0001" + ".exr".
+# the frame number has to come after a dot or an underscore and right before the extension
+# the hidden name a file waits under while a loop like a->b, b->a is renamed, see temporaryName()
+TEMPORARY_PATTERN = re.compile(r'^\.(?P<name>.+)\.\d+\.\d+\.tmp$')
+
+SEQUENCE_PATTERN = re.compile(r'^(?P<head>.*?[._])(?P<frame>\d+)(?P<tail>\.[^.]+)$')
+
+# how many journal lines are written between two fsync calls
+JOURNAL_BATCH = 256
+
+# how many files of a list are planned together, when the files come from a list instead of a directory
+LIST_BATCH = 1000
+
+# one step of a plan. action is 'rename' or 'copy', src and dest are full paths
+Operation = namedtuple('Operation', ['action', 'src', 'dest'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="This is a batch renamer",
+                                     usage="To replace all files with dell with goodbye instead: python cliRenamer.py hello goodbye")
+    # nargs='?' makes them optional, so a rules file can be used instead
+    parser.add_argument('inString', nargs='?', help="The word to replace")
+    parser.add_argument('outString', nargs='?', help="The word to replace it with")
+
+    # optional arguments usually start with a dash and they have a short form and a long form
+    # 'store_true' means if this arg is provided, while no value for it, then default to true
+    parser.add_argument('-d', '--duplicate',
+                        help="Whether to duplicate or replace in spot",
+                        action='store_true')
+
+    parser.add_argument('-r', '--regex',
+                        help="Whether the patterns are regex or not",
+                        action='store_true')
+    parser.add_argument('--rules',
+                        help="A .json or .tsv file with many replacements, which are all done in one go. "
+                             "The words given on the command line are added as the first rule")
+    parser.add_argument('-s', '--sequence',
+                        help="Treat numbered frames like name.0001.exr as sequences, "
+                             "the name is worked out once for each sequence",
+                        action='store_true')
+    parser.add_argument('--frame-offset', type=int, default=0,
+                        help="Add this to every frame number of a sequence. Only used with --sequence")
+    parser.add_argument('--start-frame', type=int,
+                        help="Renumber every sequence to start from this frame. Only used with --sequence")
+    parser.add_argument('--padding', type=int,
+                        help="How many digits the frame numbers should have. Default to keep them as they are. "
+                             "Only used with --sequence")
+
+    parser.add_argument('-o', '--output', help="The output location. Default to here")
+
+    parser.add_argument('-R', '--recursive',
+                        help="Walk into every sub folder as well, keeping the folder layout in the output location",
+                        action='store_true')
+
+    # action='append' lets an option be given many times, e.g. --include '*.exr' --include '*.tif'
+    parser.add_argument('-i', '--include', action='append',
+                        help="Only touch the files whose name matches this pattern, like '*.exr'. Can be given many times")
+    parser.add_argument('-x', '--exclude', action='append',
+                        help="Never touch the files or folders whose name matches this pattern. "
+                             "A matching folder is not walked into at all. Can be given many times")
+    parser.add_argument('-e', '--ext', action='append',
+                        help="Only touch the files with this extension, like exr. Can be given many times")
+
+    parser.add_argument('-l', '--link-mode', choices=LINK_MODES, default='copy',
+                        help="How to duplicate: hard link, reflink or copy. "
+                             "Fall back to a copy when the filesystem can not do it. Default to copy")
+
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="How many files to duplicate at the same time. Default to 1")
+
+    parser.add_argument('--async', dest='asyncMode',
+                        help="Keep many renames and copies waiting on the file server at the same time, "
+                             "for network filesystems where each call waits a full round trip",
+                        action='store_true')
+    parser.add_argument('--per-directory', type=int, default=8,
+                        help="How many operations may be in flight in one output folder. Only used with --async")
+    parser.add_argument('--per-mount', type=int, default=32,
+                        help="How many operations may be in flight on one mount. Only used with --async")
+
+    parser.add_argument('--skip-identical',
+                        help="When duplicating, skip the files whose content is already at the new name. "
+                             "Add --overwrite to replace the ones which changed",
+                        action='store_true')
+
+    parser.add_argument('--from-stdin',
+                        help="Read the files to rename from stdin, one path per line, instead of listing the folder",
+                        action='store_true')
+    parser.add_argument('-0', '--null',
+                        help="The paths from stdin are separated by NUL characters instead of new lines, "
+                             "like the output of find -print0",
+                        action='store_true')
+    parser.add_argument('--from-ndjson',
+                        help="Read the files to rename from this file, or - for stdin. "
+                             "One json line each, either a path string or an object with a 'path'")
+    parser.add_argument('--ndjson',
+                        help="Print one json line for every file that was done, skipped or failed, as it happens",
+                        action='store_true')
+
+    parser.add_argument('--stats', nargs='?', const='table', choices=('table', 'json'),
+                        help="Print how long each phase took and how many files went through it, "
+                             "as a table or as json. Default to a table")
+
+    parser.add_argument('-n', '--dry-run',
+                        help="Only print what would be done, without touching any file",
+                        action='store_true')
+
+    parser.add_argument('-f', '--overwrite',
+                        help="Replace files which already have the new name. By default they are reported and skipped",
+                        action='store_true')
+
+    parser.add_argument('--journal',
+                        help="A file to record every finished rename or copy in, so a killed run can be resumed or undone")
+    parser.add_argument('--resume',
+                        help="Skip what the journal says is already done. Needs --journal",
+                        action='store_true')
+    parser.add_argument('--undo',
+                        help="Reverse everything recorded in the journal, newest first, then stop. Needs --journal",
+                        action='store_true')
+
+    args = parser.parse_args()
+
+    # in ndjson mode stdout is only for the report
+    if not args.ndjson:
+        print(args)
+
+    if args.from_stdin and args.from_ndjson:
+        parser.error("--from-stdin and --from-ndjson can not be used together")
+
+    if args.null and not args.from_stdin:
+        parser.error("--null needs --from-stdin")
+
+    if (args.resume or args.undo) and not args.journal:
+        parser.error("--resume and --undo need --journal")
+
+    report = NdjsonReport() if args.ndjson else None
+
+    if args.undo:
+        if undo(args.journal, report, dryRun=args.dry_run):
+            sys.exit(1)
+        return
+
+    if args.jobs < 1:
+        parser.error("--jobs should be at least 1")
+
+    if args.asyncMode and args.jobs > 1:
+        parser.error("--async and --jobs can not be used together")
+
+    if args.per_directory < 1 or args.per_mount < 1:
+        parser.error("--per-directory and --per-mount should be at least 1")
+
+    renumber = args.frame_offset or args.start_frame is not None or args.padding is not None
+
+    if renumber and not args.sequence:
+        parser.error("--frame-offset, --start-frame and --padding need --sequence")
+
+    if args.frame_offset and args.start_frame is not None:
+        parser.error("--frame-offset and --start-frame can not be used together")
+
+    if args.outString is None and (args.inString is not None or not (args.rules or renumber)):
+        parser.error("inString and outString are needed, unless a --rules file or a renumbering is given")
+
+    stats = Stats() if args.stats else None
+
+    nameFilter = compileFilter(args.include, args.exclude, args.ext)
+
+    rules = loadRules(args.rules) if args.rules else None
+
+    # the bad lines of --from-ndjson, the paths are read while renaming so they are only known at the end
+    skipped = []
+
+    paths = None
+    stream = None
+    if args.from_stdin:
+        paths = readPaths(sys.stdin, '\0' if args.null else '\n')
+    elif args.from_ndjson == '-':
+        paths = readNdjson(sys.stdin, skipped, report)
+    elif args.from_ndjson:
+        stream = open(args.from_ndjson)
+        paths = readNdjson(stream, skipped, report)
+
+    try:
+        failures = rename(args.inString, args.outString, duplicate=args.duplicate, outDirectory=args.output,
+                          regex=args.regex, recursive=args.recursive, jobs=args.jobs, rules=rules,
+                          linkMode=args.link_mode, dryRun=args.dry_run, overwrite=args.overwrite,
+                          sequence=args.sequence, frameOffset=args.frame_offset, startFrame=args.start_frame,
+                          padding=args.padding, journal=args.journal, resume=args.resume,
+                          skipIdentical=args.skip_identical, paths=paths, report=report, stats=stats,
+                          asyncMode=args.asyncMode, perDirectory=args.per_directory, perMount=args.per_mount,
+                          nameFilter=nameFilter)
+    finally:
+        if stream:
+            stream.close()
+
+    failures = skipped + failures
+
+    if stats:
+        stats.failed = len(failures)
+        # keep stdout for the report in ndjson mode
+        stats.show(args.stats, sys.stderr if args.ndjson else sys.stdout)
+
+    if failures:
+        sys.exit(1)
+
+
+class CopyPool(object):
+    """
+    This is a pool of threads which runs the operations of a plan in the background.
+    It only lets a limited number of operations wait in the queue, so a huge folder does not pile up in memory.
+    A failed operation is reported and recorded, the other operations keep going.
+    """
+
+    def __init__(self, jobs, linkMode='copy', recorders=(), report=None):
+        self.linkMode = linkMode
+        self.recorders = recorders
+        self.report = report
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        # every operation takes a slot when it is queued and gives it back when it is done.
+        # when there is no slot left, submit() waits, this is the backpressure on the directory walk
+        self.slots = threading.BoundedSemaphore(jobs * 2)
+        # the number of operations which are queued or running, so wait() knows when they are all done
+        self.running = 0
+        self.idle = threading.Condition()
+        self.failures = []
+
+    def submit(self, operation):
+        self.slots.acquire()
+
+        with self.idle:
+            self.running += 1
+
+        try:
+            future = self.executor.submit(runOperation, operation, self.linkMode, self.recorders)
+        except Exception:
+            self._done()
+            raise
+
+        future.add_done_callback(lambda done: self._finish(done, operation))
+
+    def _finish(self, future, operation):
+        error = future.exception()
+
+        with self.idle:
+            if error is not None:
+                reportFailure(operation.src, operation.dest, error, self.report)
+                self.failures.append((operation.src, operation.dest, error))
+
+        self._done()
+
+    def _done(self):
+        with self.idle:
+            self.running -= 1
+            self.idle.notify_all()
+
+        self.slots.release()
+
+    def wait(self):
+        """
+        Wait until every submitted operation is finished, without closing the pool.
+        """
+        with self.idle:
+            while self.running:
+                self.idle.wait()
+
+    def close(self):
+        """
+        Wait for all the queued operations to finish.
+        Returns:
+            a list of (src, dest, error) for every operation that failed
+        """
+        self.executor.shutdown(wait=True)
+        return self.failures
+
+
+class AsyncRunner(object):
+    """
+    This runs whole plans on an asyncio event loop in a background thread, while the walk goes on in the main thread.
+    The blocking filesystem calls are put on a thread pool, and semaphores keep a limited number of them in flight
+    for each output folder and for each mount, to hide the latency without flooding the file server.
+    Like apply(), the stages of a plan run one after another, and the operations of a stage are recorded in plan order.
+    A failure is handled like the CopyPool does, not like apply() without a pool: it is reported,
+    the later stages of its plan are skipped, the other plans go on, and close() gives back every failure.
+    """
+
+    def __init__(self, perDirectory=8, perMount=32, linkMode='copy', recorders=(), report=None):
+        self.perDirectory = perDirectory
+        self.perMount = perMount
+        self.linkMode = linkMode
+        self.recorders = recorders
+        self.report = report
+        self.failures = []
+
+        # the semaphores are made inside the loop, the first time a folder or a mount is used
+        self.directories = {}
+        self.mounts = {}
+        self.mountPoints = {}
+
+        # enough threads to fill a couple of mounts, the semaphores decide how many are really busy
+        self.threads = ThreadPoolExecutor(max_workers=perMount * 2)
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.threads)
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        # the plans waiting in the loop, only a limited number of folders are planned ahead of the file server
+        self.plans = []
+        self.slots = threading.BoundedSemaphore(perMount)
+
+    def submit(self, stages):
+        # os.path.ismount is a round trip to the file server, do it here and not on the loop thread,
+        # where it would hold up every operation in flight
+        mounts = {}
+        for stage in stages:
+            for operation in stage:
+                folder = os.path.dirname(operation.dest)
+                if folder not in mounts:
+                    mounts[folder] = self._mountPoint(folder)
+
+        self.slots.acquire()
+
+        future = asyncio.run_coroutine_threadsafe(self._apply(stages, mounts), self.loop)
+        future.add_done_callback(lambda done: self.slots.release())
+
+        self.plans = [plan for plan in self.plans if not plan.done()]
+        self.plans.append(future)
+
+    async def _apply(self, stages, mounts):
+        for index, stage in enumerate(stages):
+            results = await asyncio.gather(*[self._run(operation, mounts) for operation in stage],
+                                           return_exceptions=True)
+
+            failed = False
+            for operation, result in zip(stage, results):
+                if isinstance(result, Exception):
+                    reportFailure(operation.src, operation.dest, result, self.report)
+                    self.failures.append((operation.src, operation.dest, result))
+                    failed = True
+                    continue
+
+                for recorder in self.recorders:
+                    recorder.record(operation, result)
+
+            # if something failed, the next stages could overwrite a file which was supposed to move away first
+            if failed:
+                self.failures.extend(skipStages(stages[index + 1:], self.report))
+                return
+
+    async def _run(self, operation, mounts):
+        folder = os.path.dirname(operation.dest)
+
+        # the folder slot first: the operations waiting for a busy folder must not hold mount slots
+        # which the other folders on the same mount could use
+        async with self._semaphore(self.directories, folder, self.perDirectory):
+            async with self._semaphore(self.mounts, mounts[folder], self.perMount):
+                return await self.loop.run_in_executor(None, runOperation, operation, self.linkMode)
+
+    def _semaphore(self, semaphores, key, size):
+        semaphore = semaphores.get(key)
+        if semaphore is None:
+            semaphore = semaphores[key] = asyncio.Semaphore(size)
+        return semaphore
+
+    def _mountPoint(self, folder):
+        # only called from the thread which submits the plans
+        mount = self.mountPoints.get(folder)
+        if mount is None:
+            mount = folder
+            while not os.path.ismount(mount) and os.path.dirname(mount) != mount:
+                mount = os.path.dirname(mount)
+            self.mountPoints[folder] = mount
+        return mount
+
+    def close(self):
+        """
+        Wait for all the submitted plans to finish, then stop the loop.
+        Returns:
+            a list of (src, dest, error) for every operation that failed
+        """
+        wait(self.plans)
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.threads.shutdown()
+
+        return self.failures
+
+
+class Journal(object):
+    """
+    This is an append only record of the finished operations, one json line for each.
+    Every line goes to the OS as soon as its operation is done, so a killed run loses no record.
+    Only the fsync, which guards against a power cut, is done in batches.
+    Every line is written after its operation is done, so a line in the journal is always true.
+    """
+
+    def __init__(self, path, batch=JOURNAL_BATCH):
+        self.path = path
+        self.batch = batch
+        self.count = 0
+        self.lock = threading.Lock()
+        self.file = open(path, 'a')
+
+        # a killed run could have left half a line at the end, start on a new line so it stays on its own
+        if self.file.tell():
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.file.write('\n')
+
+    def record(self, operation, size=0):
+        line = json.dumps(operation._asdict()) + '\n'
+
+        # the pool threads record at the same time
+        with self.lock:
+            self.file.write(line)
+
+            # a killed process loses what is still in the python buffer, but not what the OS already has
+            self.file.flush()
+
+            self.count += 1
+            if self.count % self.batch == 0:
+                self._sync()
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self._sync()
+                self.file.close()
+
+
+def readJournal(path):
+    """
+    This function will read the operations recorded in a journal, oldest first.
+    A half written last line, from a run which was killed while writing it, is ignored.
+    """
+    operations = []
+
+    if not os.path.exists(path):
+        return operations
+
+    with open(path) as f:
+        for line in f:
+            try:
+                operations.append(Operation(**json.loads(line)))
+            except (ValueError, TypeError):
+                continue
+
+    return operations
+
+
+def undo(path, report=None, dryRun=False):
+    """
+    This function will reverse every operation in the journal, newest first.
+    A rename is renamed back and a copy is deleted. The journal is rewritten with what could not be undone,
+    so undo can be run again after fixing the problem. It is removed when everything is undone.
+    Args:
+        path: the journal
+        report: a NdjsonReport to tell about every operation undone
+        dryRun: only print what would be undone, without touching any file or the journal
+
+    Returns:
+        a list of (src, dest, error) for every operation that could not be undone
+    """
+    failures = []
+    remaining = []
+
+    for operation in reversed(readJournal(path)):
+        if dryRun:
+            if report:
+                report.write('planned', 'undo %s' % operation.action, operation.src, operation.dest)
+            else:
+                print("undo %s: %s -> %s" % (operation.action, operation.src, operation.dest))
+            continue
+
+        try:
+            if operation.action == 'copy':
+                os.remove(operation.dest)
+            elif os.path.lexists(operation.src):
+                # never replace a file that came back in the meantime
+                raise IOError("%s already exists!" % operation.src)
+            else:
+                os.rename(operation.dest, operation.src)
+        except (IOError, OSError) as e:
+            reportFailure(operation.dest, operation.src, e, report)
+            failures.append((operation.dest, operation.src, e))
+            remaining.append(operation)
+            continue
+
+        if report:
+            report.write('undone', operation.action, operation.src, operation.dest)
+
+    if dryRun:
+        return failures
+
+    if not remaining:
+        os.remove(path)
+        return failures
+
+    temp = path + '.tmp'
+    with open(temp, 'w') as f:
+        for operation in reversed(remaining):
+            f.write(json.dumps(operation._asdict()) + '\n')
+    os.replace(temp, path)
+
+    return failures
+
+
+def reportFailure(src, dest, error, report=None):
+    sys.stderr.write("Failed: %s -> %s (%s)\n" % (src, dest, error))
+
+    if report:
+        report.write('failed', None, src, dest, error=str(error))
+
+
+class NdjsonReport(object):
+    """
+    This is a report which prints one json line for every file as soon as something happens to it,
+    so it can be piped into another tool while the renamer is still running.
+    Each line has a status ('done', 'skipped', 'failed', 'planned' or 'undone'), the action, src and dest.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def write(self, status, action, src, dest, **extra):
+        record = {'status': status, 'action': action, 'src': src, 'dest': dest}
+        record.update(extra)
+        line = json.dumps(record) + '\n'
+
+        # the pool threads report at the same time
+        with self.lock:
+            self.stream.write(line)
+            self.stream.flush()
+
+    def record(self, operation, size=0):
+        self.write('done', operation.action, operation.src, operation.dest, bytes=size)
+
+
+class Stats(object):
+    """
+    This is a record of how long each phase of a run took and how many files went through it,
+    so we can see whether a slow run was spent listing, matching or moving the data.
+    """
+
+    # the phases in the order they happen
+    PHASES = ('scan', 'match', 'compare', 'plan', 'io')
+
+    def __init__(self):
+        self.start = time.time()
+        self.phases = dict((phase, 0.0) for phase in self.PHASES)
+        self.scanned = 0
+        self.matched = 0
+        self.renamed = 0
+        self.copied = 0
+        self.skipped = 0
+        self.failed = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def timed(self, phase, iterable):
+        """
+        This generator will yield the items of iterable, adding the time spent waiting for each one to the phase.
+        """
+        iterator = iter(iterable)
+
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.phases[phase] += time.time() - start
+                return
+
+            self.phases[phase] += time.time() - start
+            yield item
+
+    def timer(self, phase):
+        """
+        This function will return a context manager which adds the time spent in it to the phase.
+        """
+        return _PhaseTimer(self, phase)
+
+    def record(self, operation, size=0):
+        # the pool threads record at the same time
+        with self.lock:
+            if operation.action == 'copy':
+                self.copied += 1
+            else:
+                self.renamed += 1
+            self.bytes += size
+
+    def results(self):
+        """
+        Returns:
+            a dict of everything recorded, with the total time and the files per second
+        """
+        total = time.time() - self.start
+        done = self.renamed + self.copied
+
+        return {
+            'phases': dict(self.phases),
+            'total': total,
+            'scanned': self.scanned,
+            'matched': self.matched,
+            'renamed': self.renamed,
+            'copied': self.copied,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'bytes': self.bytes,
+            'files_per_second': done / total if total else 0.0,
+        }
+
+    def show(self, style='table', stream=None):
+        stream = stream or sys.stdout
+        results = self.results()
+
+        if style == 'json':
+            stream.write(json.dumps(results) + '\n')
+            return
+
+        rows = [('%s time' % phase, '%.3fs' % results['phases'][phase]) for phase in self.PHASES]
+        rows.append(('total time', '%.3fs' % results['total']))
+        for key in ('scanned', 'matched', 'renamed', 'copied', 'skipped', 'failed', 'bytes'):
+            rows.append((key, str(results[key])))
+        rows.append(('files per second', '%.1f' % results['files_per_second']))
+
+        width = max(len(name) for name, value in rows)
+        for name, value in rows:
+            stream.write('%s  %s\n' % (name.ljust(width), value))
+
+
+class _PhaseTimer(object):
+
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *args):
+        self.stats.phases[self.phase] += time.time() - self.start
+
+
+def readPaths(stream, separator='\n'):
+    """
+    This generator will yield the paths from a stream as soon as each one is read.
+    Args:
+        stream: a file like object, e.g. sys.stdin
+        separator: what separates the paths, a new line or '\\0'
+
+    Returns:
+        a generator of paths
+    """
+    if separator == '\n':
+        for line in stream:
+            line = line.rstrip('\r\n')
+            if line:
+                yield line
+        return
+
+    rest = ''
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+
+        parts = (rest + chunk).split(separator)
+        # the last part could be cut in the middle, keep it for the next chunk
+        rest = parts.pop()
+        for part in parts:
+            if part:
+                yield part
+
+    if rest:
+        yield rest
+
+
+def readNdjson(stream, failures=None, report=None):
+    """
+    This generator will yield the paths from a stream of json lines, as soon as each line is read.
+    A line is either a path string, or an object with a 'path', like the lines of the --ndjson report.
+    A line which is not json or has no path is reported as a failure, and the stream goes on.
+    Args:
+        stream: a file like object, e.g. sys.stdin
+        failures: a list to add (line, None, error) to for every bad line
+        report: a NdjsonReport to tell about the bad lines
+
+    Returns:
+        a generator of paths
+    """
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+
+        path = record.get('path') if isinstance(record, dict) else record
+
+        if not isinstance(path, str):
+            error = ValueError("line %s has no path!" % number)
+            reportFailure(line, None, error, report)
+            if failures is not None:
+                failures.append((line, None, error))
+            continue
+
+        yield path
+
+
+def loadRules(path):
+    """
+    This function will read the replacement rules from a file.
+    A .json file holds either a dict of {word: replacement}, or a list of {"in": ..., "out": ..., "regex": false}.
+    Any other file is read as tab separated lines: word, replacement and an optional third column "regex".
+    Empty lines and lines starting with # are ignored.
+    Args:
+        path: the rules file
+
+    Returns:
+        a list of (inString, outString, regex)
+    """
+    rules = []
+
+    if path.lower().endswith('.json'):
+        with open(path) as f:
+            data = json.load(f)
+
+        if isinstance(data, dict):
+            rules = [(inString, outString, False) for inString, outString in data.items()]
+        elif isinstance(data, list):
+            for number, rule in enumerate(data):
+                if not isinstance(rule, dict) or 'in' not in rule or 'out' not in rule:
+                    raise ValueError("%s: rule %s needs an 'in' and an 'out'!" % (path, number))
+                rules.append((rule['in'], rule['out'], bool(rule.get('regex', False))))
+        else:
+            raise ValueError("%s should hold a dict or a list of rules!" % path)
+
+        return rules
+
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+
+            columns = line.split('\t')
+            if len(columns) not in (2, 3):
+                raise ValueError("%s line %s should have 2 or 3 tab separated columns!" % (path, number))
+
+            regex = len(columns) == 3 and columns[2].strip().lower() == 'regex'
+            rules.append((columns[0], columns[1], regex))
+
+    return rules
+
+
+def compileRules(rules):
+    """
+    This function will turn a list of rules into one function which renames a name, so the patterns are only built once.
+    The rules are applied in their order. The plain words next to each other are put into a single regex
+    like "beauty|diffuse|spec", so one scan of a name replaces all of them, each match looks its replacement up in a dict.
+    The regex rules can not be joined like that because of their groups, so each one is compiled once on its own,
+    and it splits the plain words before and after it into two scans.
+    Args:
+        rules: a list of (inString, outString, regex)
+
+    Returns:
+        a function which takes a name and returns the new name
+    """
+    # each step is a function which takes a name and returns the new name
+    steps = []
+    table = {}
+
+    def addWords(table):
+        if len(table) == 1:
+            # a single word does not need a regex, str.replace is faster
+            word, replacement = list(table.items())[0]
+            steps.append(lambda name: name.replace(word, replacement))
+            return
+
+        # the longest words first, so "beauty_spec" is picked before "beauty" at the same position
+        alternatives = sorted(table, key=len, reverse=True)
+        words = re.compile('|'.join(re.escape(word) for word in alternatives))
+        steps.append(lambda name: words.sub(lambda match: table[match.group(0)], name))
+
+    for inString, outString, regex in rules:
+        if not inString:
+            raise ValueError("A rule can not replace an empty string!")
+
+        if regex:
+            if table:
+                addWords(table)
+                table = {}
+            pattern = re.compile(inString)
+            steps.append(lambda name, pattern=pattern, outString=outString: pattern.sub(outString, name))
+        elif inString not in table:
+            # the first rule for a word wins, like it would if the rules were applied one by one
+            table[inString] = outString
+
+    if table:
+        addWords(table)
+
+    def transform(name):
+        for step in steps:
+            name = step(name)
+        return name
+
+    return transform
+
+
+def sequenceMoves(names, transform, frameOffset=0, startFrame=None, padding=None):
+    """
+    This function will group the names into frame sequences and work out the new name of every frame.
+    The sequences are keyed by the part before the frame number, the padding and the extension,
+    so shot.0001.exr and shot.001.exr are two different sequences.
+    The new name of a sequence comes from a template like "shot010_beauty.####.exr".
+    Every frame is still transformed once as well, to make sure no rule touched its frame number.
+    Args:
+        names: the file names of one folder
+        transform: the function which gives the new name, see compileRules()
+        frameOffset: a number to add to every frame
+        startFrame: the new first frame of every sequence, instead of frameOffset
+        padding: the new number of digits of the frames. Default to keep the padding of each sequence
+
+    Returns:
+        a list of (name, new name). The names which are not frames are transformed one by one
+    """
+    sequences = {}
+    moves = []
+
+    for name in names:
+        match = SEQUENCE_PATTERN.match(name)
+        if not match:
+            moves.append((name, transform(name)))
+            continue
+
+        frame = match.group('frame')
+        key = (match.group('head'), len(frame), match.group('tail'))
+        sequences.setdefault(key, []).append((int(frame), name))
+
+    for (head, width, tail), frames in sequences.items():
+        template = transform('%s%s%s' % (head, '#' * width, tail))
+
+        # the rules could have touched the frame number itself, then each frame has to be done on its own.
+        # a rule can mangle the # marks, or match the digits of some real frames, which the template does not have
+        parts = template.split('#' * width)
+        renamed = [(name, transform(name)) for frame, name in frames]
+
+        if len(parts) != 2 or '#' in parts[0] or '#' in parts[1] or \
+                any(new != parts[0] + name[len(head):len(head) + width] + parts[1] for name, new in renamed):
+            moves.extend(renamed)
+            continue
+
+        newHead, newTail = parts
+
+        offset = frameOffset
+        if startFrame is not None:
+            offset = startFrame - min(frame for frame, name in frames)
+
+        pattern = '%s%%0%sd%s' % (newHead.replace('%', '%%'), padding or width, newTail.replace('%', '%%'))
+
+        for frame, name in frames:
+            if frame + offset < 0:
+                raise ValueError("%s would get a negative frame number!" % name)
+            moves.append((name, pattern % (frame + offset)))
+
+    return moves
+
+
+def hashFile(path):
+    """
+    This function will return the sha1 of a file, reading it through mmap one chunk at a time.
+    It runs in the worker processes of compareHashes().
+    """
+    digest = hashlib.sha1()
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # an empty file can not be mapped
+        if not size:
+            return digest.hexdigest()
+
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # slicing a memoryview gives the pages of the map, slicing the mmap itself would copy them into bytes
+            pages = memoryview(view)
+            try:
+                for start in range(0, size, CHUNK_SIZE * 8):
+                    digest.update(pages[start:start + CHUNK_SIZE * 8])
+            finally:
+                # the map can not be closed while a view of it is still alive
+                pages.release()
+        finally:
+            view.close()
+
+    return digest.hexdigest()
+
+
+def compareStats(pairs):
+    """
+    This function will do the cheap part of finding the files whose content is already at their new name.
+    The size and the modified time are compared, shutil.copy2 keeps the time so an earlier copy has the same one.
+    Args:
+        pairs: a list of (src, src stat, dest) where dest already exists
+
+    Returns:
+        (identical, unsure)
+        identical is a set of the src which do not need to be copied again,
+        unsure is a list of (src, dest) with the same size but a different time, which have to be hashed
+    """
+    identical = set()
+    unsure = []
+
+    for src, srcStat, dest in pairs:
+        try:
+            destStat = os.stat(dest)
+        except OSError:
+            continue
+
+        if srcStat.st_size != destStat.st_size:
+            continue
+
+        # a hard link, or the same size and time: it is the same file
+        if (srcStat.st_ino, srcStat.st_dev) == (destStat.st_ino, destStat.st_dev) or \
+                srcStat.st_mtime_ns == destStat.st_mtime_ns or not srcStat.st_size:
+            identical.add(src)
+        else:
+            unsure.append((src, dest))
+
+    return identical, unsure
+
+
+def compareHashes(pairs, hashPool=None):
+    """
+    This function will hash both files of every pair, on the given process pool.
+    Args:
+        pairs: a list of (src, dest)
+        hashPool: a ProcessPoolExecutor to hash on. Hash here when it is None
+
+    Returns:
+        a set of the src which have the same content as their dest
+    """
+    paths = [path for pair in pairs for path in pair]
+    mapper = hashPool.map if hashPool else map
+    hashes = list(mapper(hashFile, paths))
+
+    identical = set()
+    for number, (src, dest) in enumerate(pairs):
+        if hashes[number * 2] == hashes[number * 2 + 1]:
+            identical.add(src)
+
+    return identical
+
+
+class NameFilter(object):
+    """
+    This decides which names are worth looking at, before any substitution or stat is done on them.
+    All the include patterns are compiled into one regex and all the exclude patterns into another,
+    so checking a name is at most two regex matches however many patterns there are.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = self._compile(include)
+        self.exclude = self._compile(exclude)
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+
+    def accepts(self, name):
+        """
+        Whether a file with this name should be renamed.
+        """
+        if self.exclude and self.exclude.match(name):
+            return False
+        return not self.include or bool(self.include.match(name))
+
+    def prunes(self, name):
+        """
+        Whether a folder with this name should be skipped with everything inside it.
+        The include patterns are only for files, so they never prune a folder.
+        """
+        return bool(self.exclude and self.exclude.match(name))
+
+
+def compileFilter(include=None, exclude=None, extensions=None):
+    """
+    This function will build one NameFilter from the patterns and extensions given on the command line.
+    Args:
+        include: a list of patterns, a file has to match one of them
+        exclude: a list of patterns, a file or folder matching any of them is skipped
+        extensions: a list of extensions like 'exr' or '.exr', added to the include patterns
+
+    Returns:
+        a NameFilter, or None when there is nothing to filter
+    """
+    include = list(include or [])
+    for extension in extensions or []:
+        include.append('*.%s' % extension.lstrip('.'))
+
+    if not include and not exclude:
+        return None
+
+    return NameFilter(include, exclude)
+
+
+def walk(directory, recursive=False, nameFilter=None):
+    """
+    This generator will read the given directory one folder at a time, and yield each folder as soon as it is read.
+    Args:
+        directory: the folder to look into
+        recursive: whether to walk into the sub folders as well
+        nameFilter: a NameFilter to skip files and whole sub folders by their name
+
+    Returns:
+        a generator of (folder, entries, names).
+        entries are the os.DirEntry which may be renamed. In recursive mode they are only files,
+        the folders are walked into instead.
+        names is a set of every name in the folder, including the hidden ones and the sub folders,
+        so the new names can be checked against it.
+    """
+    # a stack instead of a real recursion, so a very deep tree can not hit the recursion limit
+    pending = [directory]
+
+    while pending:
+        current = pending.pop()
+        entries = []
+        names = set()
+
+        # scandir gives back DirEntry objects which already know their type from the directory listing,
+        # so is_dir() does not cost an extra stat call for each file like os.path.isdir() would
+        with os.scandir(current) as scan:
+            for entry in scan:
+                names.add(entry.name)
+
+                # startswith('.') means it is a hidden file and should not be touched.
+                if entry.name.startswith('.'):
+                    continue
+
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    if not (nameFilter and nameFilter.prunes(entry.name)):
+                        pending.append(entry.path)
+                    continue
+
+                if nameFilter and not nameFilter.accepts(entry.name):
+                    continue
+
+                entries.append(entry)
+
+        yield current, entries, names
+
+
+class PathEntry(object):
+    """
+    This is a stand in for os.DirEntry, for the files which come from a list instead of a directory listing.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path)
+        self._stat = None
+
+    def stat(self):
+        # cached like DirEntry.stat()
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+class ExistingNames(object):
+    """
+    This is a set of names in a folder which is filled on demand. Checking a name costs one lstat the first time,
+    instead of listing the whole folder, which is much cheaper when only a few files of a huge folder are renamed.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.known = {}
+
+    def __contains__(self, name):
+        exists = self.known.get(name)
+        if exists is None:
+            exists = self.known[name] = os.path.lexists(os.path.join(self.folder, name))
+        return exists
+
+    def add(self, name):
+        self.known[name] = True
+
+
+def insidePaths(paths, directory, failures, report=None):
+    """
+    This generator will only yield the paths inside directory. The others are reported as failures,
+    their place in the output location can not be worked out and would climb out of it with '..'.
+    Args:
+        paths: an iterable of paths, e.g. from readPaths()
+        directory: an absolute folder
+        failures: a list to add (path, None, error) to for every path outside of directory
+        report: a NdjsonReport to tell about them
+
+    Returns:
+        a generator of paths
+    """
+    for path in paths:
+        try:
+            inside = os.path.commonpath([directory, os.path.abspath(path)]) == directory
+        except ValueError:
+            # on windows, a path on another drive
+            inside = False
+
+        if inside:
+            yield path
+            continue
+
+        error = ValueError("%s is not inside %s!" % (path, directory))
+        reportFailure(path, None, error, report)
+        failures.append((path, None, error))
+
+
+def listEntries(paths, batch=LIST_BATCH, nameFilter=None):
+    """
+    This generator does the same as walk(), for a stream of paths instead of a directory.
+    The paths of the same folder which come one after another are yielded together, at most batch of them at once.
+    Args:
+        paths: an iterable of paths, e.g. from readPaths()
+        batch: the most paths yielded at once
+        nameFilter: a NameFilter to skip files by their name
+
+    Returns:
+        a generator of (folder, entries, names), names is an ExistingNames of the folder
+    """
+    folder = None
+    entries = []
+    seen = set()
+
+    for path in paths:
+        entry = PathEntry(path)
+
+        # startswith('.') means it is a hidden file and should not be touched.
+        if not entry.name or entry.name.startswith('.'):
+            continue
+
+        if nameFilter and not nameFilter.accepts(entry.name):
+            continue
+
+        parent = os.path.dirname(entry.path)
+        if entries and (parent != folder or len(entries) >= batch):
+            yield folder, entries, ExistingNames(folder)
+            entries = []
+            seen = set()
+
+        folder = parent
+
+        if entry.name not in seen:
+            seen.add(entry.name)
+            entries.append(entry)
+
+    if entries:
+        yield folder, entries, ExistingNames(folder)
+
+
+def plan(folder, destFolder, moves, existing, duplicate=False, overwrite=False):
+    """
+    This function will work out every operation needed to give the files of one folder their new names,
+    before anything is touched.
+    Args:
+        folder: where the files are
+        destFolder: where the new files go, it could be the same as folder
+        moves: a list of (name, new name)
+        existing: a set of the names already in destFolder
+        duplicate: whether to copy the files instead of renaming them
+        overwrite: whether a new name may replace a file which is already there
+
+    Returns:
+        (stages, conflicts)
+        stages is a list of lists of Operation. The operations in one stage do not depend on each other,
+        every stage has to be finished before the next one starts.
+        conflicts is a list of (src, dest, error) for the files which can not get their new name.
+    """
+    action = 'copy' if duplicate else 'rename'
+    inPlace = os.path.normpath(folder) == os.path.normpath(destFolder)
+    conflicts = []
+
+    def conflict(src, dest, message):
+        conflicts.append((os.path.join(folder, src), os.path.join(destFolder, dest), IOError(message)))
+
+    # name -> new name, and the other way around. Two files can not get the same new name
+    pending = {}
+    claimed = {}
+    for name, newName in moves:
+        if newName in claimed:
+            conflict(name, newName, "%s is also the new name of %s!" % (newName, claimed[newName]))
+            continue
+
+        pending[name] = newName
+        claimed[newName] = name
+
+    def blocked(newName):
+        # a file renamed in the same folder frees its old name, so another file can take it
+        if inPlace and not duplicate and newName in pending:
+            return False
+        return newName in existing and not overwrite
+
+    # a file which can not move does not free its name either,
+    # so the file waiting for that name has to be dropped as well
+    dropped = [name for name, newName in pending.items() if blocked(newName)]
+    while dropped:
+        name = dropped.pop()
+        if name not in pending:
+            continue
+
+        newName = pending.pop(name)
+        del claimed[newName]
+        conflict(name, newName, "%s already exists!" % os.path.join(destFolder, newName))
+
+        waiting = claimed.get(name)
+        if waiting is not None and blocked(name):
+            dropped.append(waiting)
+
+    stages = []
+
+    def add(level, operation):
+        while len(stages) <= level:
+            stages.append([])
+        stages[level].append(operation)
+
+    def src(name):
+        return os.path.join(folder, name)
+
+    def dest(name):
+        return os.path.join(destFolder, name)
+
+    if not inPlace:
+        # nothing can depend on anything else, everything goes in one stage
+        for name in sorted(pending):
+            add(0, Operation(action, src(name), dest(pending[name])))
+        return stages, conflicts
+
+    # in the same folder a new name could be the old name of another file, like a->b, b->c.
+    # b->c has to be done before a->b, so each file goes one stage before the file it waits for.
+    # every name is wanted by one file at most, so the files only form simple chains and simple loops
+    done = set()
+
+    for name in sorted(pending):
+        # only start from the head of a chain, the file whose own name nobody wants
+        if name in claimed:
+            continue
+
+        chain = [name]
+        while chain[-1] in pending and pending[chain[-1]] in pending:
+            chain.append(pending[chain[-1]])
+
+        for level, link in enumerate(reversed(chain)):
+            add(level, Operation(action, src(link), dest(pending[link])))
+            done.add(link)
+
+    # what is left are loops like a->b, b->a. One file is moved to a temporary name first to break the loop
+    for name in sorted(pending):
+        if name in done:
+            continue
+
+        loop = [name]
+        while pending[loop[-1]] != name:
+            loop.append(pending[loop[-1]])
+        done.update(loop)
+
+        temp = temporaryName(pending[name], existing)
+        add(0, Operation(action, src(name), dest(temp)))
+
+        for level, link in enumerate(reversed(loop[1:])):
+            add(level + 1, Operation(action, src(link), dest(pending[link])))
+
+        # the temporary file is already a copy, it only needs to be renamed
+        add(len(loop), Operation('rename', dest(temp), dest(pending[name])))
+
+    return stages, conflicts
+
+
+def temporaryName(name, existing):
+    """
+    This function will return a hidden name which is not used in the folder yet, so the walk never picks it up.
+    name is the name the file is going to get in the end, so a resumed run can still tell where it goes.
+    """
+    count = 0
+    while True:
+        temp = '.%s.%s.%s.tmp' % (name, os.getpid(), count)
+        if temp not in existing:
+            existing.add(temp)
+            return temp
+        count += 1
+
+
+def runOperation(operation, linkMode='copy', recorders=()):
+    """
+    This function will do one Operation of a plan, then tell the recorders (Journal, NdjsonReport, Stats) about it.
+
+    Returns:
+        the number of bytes which were really copied
+    """
+    size = 0
+
+    if operation.action == 'copy':
+        size = duplicateFile(operation.src, operation.dest, linkMode)
+    else:
+        os.rename(operation.src, operation.dest)
+
+    for recorder in recorders:
+        recorder.record(operation, size)
+
+    return size
+
+
+def apply(stages, pool=None, linkMode='copy', recorders=(), report=None):
+    """
+    This function will run the stages of a plan in order.
+    Args:
+        stages: the stages given back by plan()
+        pool: a CopyPool to run the operations of a stage at the same time. Run them one by one when it is None
+        linkMode: how to duplicate the files, one of LINK_MODES
+        recorders: the Journal, NdjsonReport and Stats to record the finished operations in
+        report: a NdjsonReport to tell about the failed operations
+
+    Returns:
+        None
+    """
+    for index, stage in enumerate(stages):
+        if not pool:
+            for operation in stage:
+                try:
+                    runOperation(operation, linkMode, recorders)
+                except (IOError, OSError) as e:
+                    reportFailure(operation.src, operation.dest, e, report)
+                    raise
+            continue
+
+        failed = len(pool.failures)
+
+        for operation in stage:
+            pool.submit(operation)
+
+        if index + 1 == len(stages):
+            break
+
+        # the next stage needs this one to be finished
+        pool.wait()
+
+        # if something failed, the next stages could overwrite a file which was supposed to move away first
+        if len(pool.failures) != failed:
+            pool.failures.extend(skipStages(stages[index + 1:], report))
+            break
+
+
+def skipStages(stages, report=None):
+    """
+    This function will report every operation of the given stages as skipped, after an earlier stage failed.
+
+    Returns:
+        a list of (src, dest, error) for the skipped operations
+    """
+    failures = []
+
+    for stage in stages:
+        for operation in stage:
+            error = IOError("skipped because an earlier step failed")
+            reportFailure(operation.src, operation.dest, error, report)
+            failures.append((operation.src, operation.dest, error))
+
+    return failures
+
+
+def duplicateFile(src, dest, linkMode='copy'):
+    """
+    This function will duplicate src to dest with as little data moving through python as possible.
+    Args:
+        src: the file to duplicate
+        dest: the new file
+        linkMode: 'hard' makes a hard link, 'reflink' shares the data blocks, 'copy' lets the kernel copy the bytes.
+                  Each one falls back to the next cheaper way to copy when the filesystem does not support it
+
+    Returns:
+        the number of bytes which were really copied, 0 for a link
+    """
+    if linkMode == 'hard':
+        try:
+            hardLink(src, dest)
+            return 0
+        except OSError as e:
+            # e.g. src and dest are on different filesystems
+            if e.errno not in UNSUPPORTED_ERRORS:
+                raise
+
+    # opening dest follows a symlink, so a hard link or a symlink to src would be emptied before it is read
+    if sameFile(src, dest, follow=True):
+        raise shutil.SameFileError("%s and %s are the same file" % (src, dest))
+
+    size = 0
+
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        if not (linkMode == 'reflink' and reflink(fsrc, fdst)):
+            kernelCopy(fsrc, fdst)
+            size = fdst.tell()
+
+    # keep the same time stamps and permission bits as shutil.copy2 does
+    shutil.copystat(src, dest)
+
+    return size
+
+
+def sameFile(src, dest, follow=True):
+    """
+    This function will check if dest is another name of the src file, e.g. a hard link made by an earlier run.
+    Args:
+        src: the source file
+        dest: the new file, it may not exist yet
+        follow: whether a symlink dest counts as what it points to, like shutil does.
+                When False only dest itself is checked, for the callers which replace dest instead of writing in it
+
+    Returns:
+        bool
+    """
+    try:
+        dest = os.stat(dest) if follow else os.lstat(dest)
+    except OSError:
+        return False
+
+    src = os.stat(src)
+    return (src.st_dev, src.st_ino) == (dest.st_dev, dest.st_ino)
+
+
+def hardLink(src, dest):
+    """
+    This function will make dest another name of src. An existing dest is replaced, as a copy would do.
+    """
+    if sameFile(src, dest, follow=False):
+        # os.replace does nothing between two names of one file, and would leave the temporary link behind
+        return
+
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+        # link to a temporary name first, then swap it in, so dest is never missing
+        temp = '%s.%s.tmp' % (dest, os.getpid())
+        os.link(src, temp)
+        try:
+            os.replace(temp, dest)
+        except OSError:
+            os.remove(temp)
+            raise
+
+
+def reflink(fsrc, fdst):
+    """
+    This function will ask the filesystem (btrfs, xfs ...) to share the data blocks of fsrc with fdst.
+
+    Returns:
+        True if it worked, False if the filesystem can not do it
+    """
+    if fcntl is None:
+        return False
+
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except (IOError, OSError) as e:
+        if e.errno not in UNSUPPORTED_ERRORS:
+            raise
+        return False
+
+    return True
+
+
+def kernelCopy(fsrc, fdst):
+    """
+    This function will copy the content of fsrc into fdst inside the kernel when possible,
+    with copy_file_range first and then sendfile. The bytes only go through python when both are not supported.
+    """
+    infd = fsrc.fileno()
+    outfd = fdst.fileno()
+
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    if copy_file_range:
+        try:
+            # copy_file_range moves both file positions, so we only need to call it until there is nothing left
+            while copy_file_range(infd, outfd, CHUNK_SIZE * 64):
+                pass
+            return
+        except OSError as e:
+            # only fall back when nothing has been written yet
+            if e.errno not in UNSUPPORTED_ERRORS or fdst.tell():
+                raise
+
+    sendfile = getattr(os, 'sendfile', None)
+    if sendfile:
+        offset = 0
+        try:
+            while True:
+                sent = sendfile(outfd, infd, offset, CHUNK_SIZE * 64)
+                if not sent:
+                    return
+                offset += sent
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRORS or offset:
+                raise
+
+    shutil.copyfileobj(fsrc, fdst, CHUNK_SIZE)
+
+
+def rename(inString, outString, duplicate=True, inDirectory=None, outDirectory=None, regex=False, recursive=False,
+           jobs=1, linkMode='copy', dryRun=False, overwrite=False, rules=None, sequence=False, frameOffset=0,
+           startFrame=None, padding=None, journal=None, resume=False, skipIdentical=False, paths=None, report=None,
+           stats=None, asyncMode=False, perDirectory=8, perMount=32, nameFilter=None):
+    """
+    This function will rename or duplicate every file whose name contains inString.
+    Each folder is planned first, then the plan is applied in one pass.
+    Args:
+        inString: the word or the regex pattern to replace
+        outString: the word to replace it with
+        duplicate: whether to copy the files with the new name instead of renaming them
+        inDirectory: where the files are. Default to the current working directory
+        outDirectory: where the new files go. Default to inDirectory
+        regex: whether inString is a regex pattern or not
+        recursive: whether to walk into every sub folder as well
+        jobs: how many files to duplicate at the same time. Only used with duplicate
+        linkMode: how to duplicate the files, one of LINK_MODES. Only used with duplicate
+        dryRun: only print the plan, without touching any file
+        overwrite: whether a new name may replace a file which is already there
+        rules: a list of (inString, outString, regex) to apply as well, see loadRules()
+        sequence: whether to treat numbered frames as sequences, see sequenceMoves()
+        frameOffset: a number to add to every frame. Only used with sequence
+        startFrame: the new first frame of every sequence. Only used with sequence
+        padding: the new number of digits of the frames. Only used with sequence
+        journal: a file to record every finished operation in, see Journal
+        resume: skip the operations which the journal says are already done, and finish the loops it was killed in
+        skipIdentical: when duplicating, skip the files whose content is already at the new name, see compareStats()
+        paths: an iterable of the files to rename, instead of listing inDirectory. The layout in outDirectory is still
+               relative to inDirectory
+        report: a NdjsonReport to tell about every file, instead of printing
+        stats: a Stats to record the time of each phase and the number of files in
+        asyncMode: whether to run the plans on an asyncio loop, see AsyncRunner
+        perDirectory: how many operations may be in flight in one output folder. Only used with asyncMode
+        perMount: how many operations may be in flight on one mount. Only used with asyncMode
+        nameFilter: a NameFilter to skip files and sub folders by their name before anything else, see compileFilter()
+
+    Returns:
+        a list of (src, dest, error) for every file that could not get its new name.
+        When jobs is 1 and asyncMode is off, an error while applying the plan is raised straight away.
+        With jobs above 1 or asyncMode, the run goes on and the failures are only given back here
+    """
+
+    if not inDirectory:
+
+        # getcwd means get current working directory
+        inDirectory = os.getcwd()
+    if not outDirectory:
+        outDirectory = inDirectory
+
+    if not report:
+        print(outDirectory)
+
+    inDirectory = os.path.abspath(inDirectory)
+    outDirectory = os.path.abspath(outDirectory)
+
+    if not os.path.exists(outDirectory):
+        raise IOError("%s does not exist!" % outDirectory)
+
+    if not os.path.exists(inDirectory):
+        raise IOError("%s does not exist!" % inDirectory)
+
+    # use regex replace or not
+    # so we can use "[tT]orus" or "^sphere" to make the condition more specific
+    allRules = list(rules or [])
+    if inString:
+        allRules.insert(0, (inString, outString, regex))
+
+    # build the patterns once here instead of once per file
+    transform = compileRules(allRules)
+
+    # the files we have already written during this run.
+    # when the output location is inside the input location, the walk could find them again later
+    created = set()
+
+    # the names in each output folder which is not also the input folder, read once per folder
+    index = {}
+
+    # what an earlier run has already done, as (src, dest)
+    finished = set()
+
+    # the files a killed run left under a temporary name in the middle of a loop
+    stranded = []
+
+    if resume:
+        operations = readJournal(journal)
+        for operation in operations:
+            finished.add((operation.src, operation.dest))
+            # the files made by the earlier run must not be renamed a second time
+            created.add(operation.dest)
+        stranded = strandedTemporaries(operations)
+
+    if journal and not dryRun:
+        journal = Journal(journal)
+    else:
+        journal = None
+
+    # everything which wants to know about a finished operation
+    recorders = [recorder for recorder in (journal, report, stats) if recorder]
+
+    # the phases are timed anyway, it only costs a few clock reads per folder
+    if stats is None:
+        stats = Stats()
+
+    pool = None
+    if duplicate and jobs > 1 and not dryRun:
+        pool = CopyPool(jobs, linkMode, recorders, report)
+
+    runner = None
+    if asyncMode and not dryRun:
+        runner = AsyncRunner(perDirectory, perMount, linkMode, recorders, report)
+
+    failures = []
+
+    if paths is None:
+        folders = walk(inDirectory, recursive=recursive, nameFilter=nameFilter)
+    else:
+        if outDirectory != inDirectory:
+            # the sub folders in the output location are worked out from inDirectory
+            paths = insidePaths(paths, inDirectory, failures, report)
+        folders = listEntries(paths, nameFilter=nameFilter)
+
+    # only started when there is something to hash, starting processes is not free
+    hashPool = None
+
+    try:
+        for folder, entries, names in stats.timed('scan', folders):
+            stats.scanned += len(entries)
+
+            with stats.timer('match'):
+                candidates = [entry.name for entry in entries if entry.path not in created]
+
+                if sequence:
+                    moves = sequenceMoves(candidates, transform, frameOffset, startFrame, padding)
+                else:
+                    moves = [(f, transform(f)) for f in candidates]
+
+                # keep the same sub folder in the output location as the files have in the input location
+                destFolder = os.path.normpath(os.path.join(outDirectory, os.path.relpath(folder, inDirectory)))
+
+                # if nothing happened, or it was already done before, then skip it
+                moves = [(f, name) for f, name in moves if name != f]
+                stats.matched += len(moves)
+
+                if finished:
+                    count = len(moves)
+                    moves = skipMoves(folder, destFolder, moves, finished, "done in an earlier run", report)
+                    stats.skipped += count - len(moves)
+
+            if not moves:
+                continue
+
+            if destFolder == folder:
+                existing = names
+            else:
+                existing = index.get(destFolder)
+                if existing is None:
+                    existing = listNames(destFolder) if paths is None else ExistingNames(destFolder)
+                    index[destFolder] = existing
+
+            if duplicate and skipIdentical:
+                with stats.timer('compare'):
+                    # the DirEntry caches its stat, so each file is only stat'ed once
+                    byName = dict((entry.name, entry) for entry in entries)
+                    pairs = [(os.path.join(folder, f), byName[f].stat(), os.path.join(destFolder, name))
+                             for f, name in moves if name in existing]
+
+                    identical, unsure = compareStats(pairs)
+
+                    if unsure:
+                        if hashPool is None:
+                            hashPool = ProcessPoolExecutor()
+                        identical.update(compareHashes(unsure, hashPool))
+
+                    identical = set((src, dest) for src, stat, dest in pairs if src in identical)
+                    moves = skipMoves(folder, destFolder, moves, identical, "identical", report)
+                    stats.skipped += len(identical)
+
+            with stats.timer('plan'):
+                stages, conflicts = plan(folder, destFolder, moves, existing, duplicate=duplicate,
+                                         overwrite=overwrite)
+
+            for src, dest, error in conflicts:
+                reportFailure(src, dest, error, report)
+            failures.extend(conflicts)
+
+            if dryRun:
+                for stage in stages:
+                    for operation in stage:
+                        if report:
+                            report.write('planned', operation.action, operation.src, operation.dest)
+                        else:
+                            print("%s: %s -> %s" % (operation.action, operation.src, operation.dest))
+                continue
+
+            with stats.timer('io'):
+                if stages and not os.path.isdir(destFolder):
+                    os.makedirs(destFolder)
+
+                if runner:
+                    runner.submit(stages)
+                else:
+                    apply(stages, pool, linkMode, recorders, report)
+
+            for stage in stages:
+                for operation in stage:
+                    created.add(operation.dest)
+                    existing.add(os.path.basename(operation.dest))
+    finally:
+        # always wait for the operations already queued, even when the walk itself failed
+        if pool:
+            with stats.timer('io'):
+                failures.extend(pool.close())
+        if runner:
+            with stats.timer('io'):
+                failures.extend(runner.close())
+        # only now every file of the loops has moved out of the way
+        if stranded:
+            with stats.timer('io'):
+                failures.extend(finishTemporaries(stranded, linkMode, recorders, report, dryRun))
+        if journal:
+            journal.close()
+        if hashPool:
+            hashPool.shutdown()
+
+    return failures
+
+
+def strandedTemporaries(operations):
+    """
+    This function will find the files an earlier run left under a temporary name, when it was killed in a loop.
+    Args:
+        operations: the operations of the journal, oldest first
+
+    Returns:
+        a list of Operation to rename each temporary file to its final name
+    """
+    moved = set(operation.src for operation in operations)
+    stranded = []
+
+    for operation in operations:
+        folder, name = os.path.split(operation.dest)
+        match = TEMPORARY_PATTERN.match(name)
+        if match and operation.dest not in moved:
+            stranded.append(Operation('rename', operation.dest, os.path.join(folder, match.group('name'))))
+
+    return stranded
+
+
+def finishTemporaries(operations, linkMode='copy', recorders=(), report=None, dryRun=False):
+    """
+    This function will give the stranded temporary files their final names, once the rest of the run is done
+    and the files which were in the way have moved. A name which is still taken is reported, never replaced.
+
+    Returns:
+        a list of (src, dest, error) for every file that could not get its final name
+    """
+    failures = []
+
+    for operation in operations:
+        if dryRun:
+            if report:
+                report.write('planned', operation.action, operation.src, operation.dest)
+            else:
+                print("%s: %s -> %s" % (operation.action, operation.src, operation.dest))
+            continue
+
+        try:
+            if not os.path.lexists(operation.src):
+                raise IOError("%s does not exist!" % operation.src)
+            if os.path.lexists(operation.dest):
+                raise IOError("%s already exists!" % operation.dest)
+            runOperation(operation, linkMode, recorders)
+        except (IOError, OSError) as e:
+            reportFailure(operation.src, operation.dest, e, report)
+            failures.append((operation.src, operation.dest, e))
+
+    return failures
+
+
+def skipMoves(folder, destFolder, moves, skip, reason, report=None):
+    """
+    This function will take out the moves whose (src, dest) is in skip, and tell the report about them.
+    """
+    kept = []
+
+    for f, name in moves:
+        src = os.path.join(folder, f)
+        dest = os.path.join(destFolder, name)
+
+        if (src, dest) not in skip:
+            kept.append((f, name))
+        elif report:
+            report.write('skipped', None, src, dest, reason=reason)
+
+    return kept
+
+
+def listNames(folder):
+    """
+    This function will return a set of every name in the folder, or an empty set when the folder does not exist yet.
+    """
+    try:
+        return set(os.listdir(folder))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return set()
+
+
+# the namespace is only equal to __main__ when running the scripts directly
+if __name__ == '__main__':
+    main()
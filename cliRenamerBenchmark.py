@@ -0,0 +1,198 @@
+# a benchmark for cliRenamer, it builds fake render folders and times the renamer on them
+# e.g. python cliRenamerBenchmark.py --sizes 1000 10000 --output results.json
+
+import argparse
+
+# redirect_stdout lets us silence the prints of cliRenamer.rename while it is timed
+import contextlib
+
+import json
+
+import os
+
+import platform
+
+import shutil
+
+import sys
+
+import tempfile
+
+import time
+
+import cliRenamer
+
+SIZES = (1000, 10000, 100000, 1000000)
+LAYOUTS = ('flat', 'nested')
+
+# mode: (inString, outString, keyword arguments for cliRenamer.rename)
+MODES = {
+    'replace': ('beauty', 'bty', {'duplicate': False}),
+    'duplicate': ('beauty', 'bty', {'duplicate': True}),
+    'regex': (r'_v(\d+)', r'_ver\1', {'duplicate': False, 'regex': True}),
+}
+
+# how many files go in one folder of a nested tree
+FOLDER_SIZE = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="This is a benchmark for the batch renamer",
+                                     usage="python cliRenamerBenchmark.py --sizes 1000 10000 --output results.json")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help="How many files each tree has. Default to 1000 and 10000, up to %s" % SIZES[-1])
+    parser.add_argument('--layouts', nargs='+', choices=LAYOUTS, default=list(LAYOUTS),
+                        help="Flat puts every file in one folder, nested spreads them over shot folders")
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=sorted(MODES),
+                        help="Which renamer modes to time")
+    parser.add_argument('--file-size', type=int, default=0,
+                        help="How many bytes each file has. Default to empty files")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="How many times to time each case, every time on a new tree")
+    parser.add_argument('--label', help="A name for this run, e.g. the branch, so runs can be told apart later")
+    parser.add_argument('--directory', help="Where to build the trees. Default to a temporary folder")
+    parser.add_argument('-o', '--output', help="The json file to write the results to. Default to print them")
+
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.layouts, args.modes, fileSize=args.file_size, repeat=args.repeat,
+                        directory=args.directory)
+
+    report = {
+        'label': args.label,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    else:
+        json.dump(report, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+
+
+def fileNames(count):
+    """
+    This generator will yield a mix of names like a real render output folder:
+    mostly frame sequences, with some versioned plates and some files which match no rule at all.
+    Args:
+        count: how many names to make
+
+    Returns:
+        a generator of names
+    """
+    for number in range(count):
+        kind = number % 10
+
+        if kind < 6:
+            # a 100 frame beauty sequence for each shot
+            yield 'shot%04d_beauty.%04d.exr' % (number // 100, number % 100 + 1001)
+        elif kind < 8:
+            yield 'plate%06d_v%03d.dpx' % (number, number % 7 + 1)
+        else:
+            yield 'notes_%06d.txt' % number
+
+
+def buildTree(directory, count, layout='flat', fileSize=0):
+    """
+    This function will fill the directory with count files.
+    Args:
+        directory: an empty folder
+        count: how many files to make
+        layout: 'flat' puts every file in the directory, 'nested' puts FOLDER_SIZE files in each seq/shot folder
+        fileSize: how many bytes each file has
+
+    Returns:
+        None
+    """
+    data = b'\0' * fileSize
+
+    for number, name in enumerate(fileNames(count)):
+        folder = directory
+        if layout == 'nested':
+            group = number // FOLDER_SIZE
+            folder = os.path.join(directory, 'seq%03d' % (group // 10), 'shot%04d' % group)
+            if number % FOLDER_SIZE == 0:
+                os.makedirs(folder)
+
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(data)
+
+
+def timeRename(directory, mode):
+    """
+    This function will run cliRenamer.rename on a built tree in one of the MODES.
+
+    Returns:
+        a dict with the time taken and the numbers recorded by cliRenamer.Stats
+    """
+    inString, outString, options = MODES[mode]
+    source = os.path.join(directory, 'in')
+    output = os.path.join(directory, 'out')
+    os.mkdir(output)
+
+    if not options['duplicate']:
+        output = None
+
+    stats = cliRenamer.Stats()
+
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.time()
+            failures = cliRenamer.rename(inString, outString, inDirectory=source, outDirectory=output,
+                                         recursive=True, stats=stats, **options)
+            seconds = time.time() - start
+
+    result = stats.results()
+    result['seconds'] = seconds
+    result['failures'] = len(failures)
+
+    return result
+
+
+def benchmark(sizes, layouts=LAYOUTS, modes=None, fileSize=0, repeat=1, directory=None):
+    """
+    This function will time every mode on every size and layout, each time on a new tree.
+    Args:
+        sizes: a list of file counts
+        layouts: a list of LAYOUTS
+        modes: a list of the MODES names. Default to all of them
+        fileSize: how many bytes each file has
+        repeat: how many times to time each case
+        directory: where to build the trees. Default to a temporary folder
+
+    Returns:
+        a list of dict, one for each run
+    """
+    results = []
+
+    for size in sizes:
+        for layout in layouts:
+            for mode in modes or sorted(MODES):
+                for run in range(repeat):
+                    root = tempfile.mkdtemp(prefix='cliRenamerBenchmark_', dir=directory)
+                    try:
+                        os.mkdir(os.path.join(root, 'in'))
+
+                        start = time.time()
+                        buildTree(os.path.join(root, 'in'), size, layout, fileSize)
+                        build = time.time() - start
+
+                        result = timeRename(root, mode)
+                    finally:
+                        shutil.rmtree(root)
+
+                    result.update({'size': size, 'layout': layout, 'mode': mode, 'run': run, 'build': build})
+                    results.append(result)
+
+                    sys.stderr.write("%s files, %s, %s: %.3fs\n" % (size, layout, mode, result['seconds']))
+
+    return results
+
+
+# the namespace is only equal to __main__ when running the scripts directly
+if __name__ == '__main__':
+    main()
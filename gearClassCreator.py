@@ -1,5 +1,7 @@
 from maya import cmds
 
+from gearCreator import sideFaces
+
 
 class Gear(object):
     """
@@ -16,14 +18,8 @@ class Gear(object):
         spans = teeth * 2
         self.transform, self.constructor = cmds.polyPipe(sa=spans)
 
-        sidefaces = range(spans * 2, spans * 3, 2)
-
-        cmds.select(clear=True)
-
-        for face in sidefaces:
-            cmds.select("%s.f[%s]" % (self.transform, face), add=True)
-
-        self.extrude = cmds.polyExtrudeFacet(ltz=length)[0]
+        # the faces are given to the extrude straight away, the selection is never touched
+        self.extrude = cmds.polyExtrudeFacet(sideFaces(spans, self.transform), ltz=length)[0]
 
     def modifyTeeth(self, teeth=20, length=10):
         spans = teeth * 2
@@ -31,14 +27,8 @@ class Gear(object):
         # get the construction node to reset it
         cmds.polyPipe(self.constructor, edit=True, sa=spans)
 
-        sidefaces = range(spans * 2, spans * 3, 2)
-        facenames = []
-
         # get string list like ['f[40]','f[42]','f[44]']
-
-        for face in sidefaces:
-            facename = 'f[%s]' % face
-            facenames.append(facename)
+        facenames = sideFaces(spans)
 
         # need more time to think this setAttr()
         # for this case, we change extrude.inputComponents with some new index
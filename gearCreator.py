@@ -1,6 +1,23 @@
 from maya import cmds
 
 
+def sideFaces(spans, transform=None):
+    """
+    This function will get the faces the teeth are extruded from, every other face of the outer side of the pipe.
+    Maya has no step in a component range like f[40:60], so this is one name for each face,
+    but they all go to Maya in a single command instead of one select for each face.
+    Args:
+        spans: the subdivisions axis of the pipe
+        transform: the object the faces belong to. Default to names without object, like in a componentList
+
+    Returns:
+        a string list like ['pPipe1.f[40]','pPipe1.f[42]'] or ['f[40]','f[42]']
+    """
+    prefix = '%s.' % transform if transform else ''
+
+    return ['%sf[%s]' % (prefix, face) for face in range(spans * 2, spans * 3, 2)]
+
+
 def createGear(teeth=10, length=5):
     """
     This function will create a gear with ideal teeth num and length.
@@ -14,14 +31,8 @@ def createGear(teeth=10, length=5):
     spans = teeth * 2
     transform, constructor = cmds.polyPipe(sa=spans)
 
-    sidefaces = range(spans * 2, spans * 3, 2)
-
-    cmds.select(clear=True)
-
-    for face in sidefaces:
-        cmds.select("%s.f[%s]" % (transform, face), add=True)
-
-    extrude = cmds.polyExtrudeFacet(ltz=length)[0]
+    # the faces are given to the extrude straight away, the selection is never touched
+    extrude = cmds.polyExtrudeFacet(sideFaces(spans, transform), ltz=length)[0]
     print transform, constructor, extrude
 
     return transform, constructor, extrude
@@ -44,14 +55,8 @@ def modifyTeeth(constructor, extrude, teeth=20, length=10):
     # get the construction node to reset it
     cmds.polyPipe(constructor, edit=True, sa=spans)
 
-    sidefaces = range(spans * 2, spans * 3, 2)
-    facenames = []
-
     # get string list like ['f[40]','f[42]','f[44]']
-
-    for face in sidefaces:
-        facename = 'f[%s]' % face
-        facenames.append(facename)
+    facenames = sideFaces(spans)
 
     # need more time to think this setAttr()
     # for this case, we change extrude.inputComponents with some new index
@@ -0,0 +1,364 @@
+import numpy as np
+
+# the geometry is plain numpy, so it can be built and checked without Maya.
+# Maya is only needed to turn the arrays into a mesh
+try:
+    from maya import cmds
+    from maya.api import OpenMaya as om
+except ImportError:
+    cmds = None
+    om = None
+
+# the levels of detail of an involute gear, from the closest to the farthest, as lodGroup wants its children.
+# name, points along each flank, points between the flanks on the tip, on the root,
+# and up to how many outer radii away from the camera this level is shown
+LODS = (
+    ('render', 12, 4, 6, 20),
+    ('mid', 4, 1, 2, 80),
+    ('proxy', 1, 0, 0, None),
+)
+
+# {(teeth, pressure angle, lods): {lod name: (outer radii, outer angles, inner angles)}}, for a module of 1.
+# the shape of a tooth only depends on these, so a mechanism with many gears of the same teeth only works it out once
+_PROFILES = {}
+
+# {num of points: (counts, connects)} of the rings made by ringArrays()
+_RINGS = {}
+
+
+def gearArrays(teeth=10, length=5, radius=1.0, thickness=0.5, height=2.0):
+    """
+    This function will work out the mesh of a gear, the same shape createGear() makes from a polyPipe and an extrude,
+    but as arrays, without any construction history.
+    Each cap has three rings of teeth * 2 points: the inner ring, the base ring on the outer side
+    and the tip ring at the end of the teeth. Every face is a quad.
+    Args:
+        teeth: the num of teeth
+        length: the length of teeth
+        radius: the outer radius, where the teeth start
+        thickness: the distance from the outer radius to the hole in the middle
+        height: the height of the gear along Y
+
+    Returns:
+        (points, counts, connects)
+        points is a (teeth * 12, 3) float array,
+        counts is the number of points of each face,
+        connects is the point index of each face corner, face after face
+    """
+    spans = teeth * 2
+    angles = np.arange(spans) * (2 * np.pi / spans)
+    directions = np.stack([np.cos(angles), np.zeros(spans), np.sin(angles)], axis=1)
+
+    inner = directions * (radius - thickness)
+    base = directions * radius
+
+    # like polyExtrudeFacet, a tooth grows along the normal of its face, so its two sides stay parallel
+    middles = angles[::2] + np.pi / spans
+    normals = np.stack([np.cos(middles), np.zeros(teeth), np.sin(middles)], axis=1)
+    tip = base + np.repeat(normals, 2, axis=0) * length
+
+    ring = np.concatenate([inner, base, tip])
+    top = ring + (0, height / 2.0, 0)
+    bottom = ring - (0, height / 2.0, 0)
+    points = np.concatenate([top, bottom])
+
+    # the point indices of each ring, the bottom cap starts after the top one
+    span = np.arange(spans)
+    innerTop, baseTop, tipTop = span, span + spans, span + spans * 2
+    innerBottom, baseBottom, tipBottom = innerTop + spans * 3, baseTop + spans * 3, tipTop + spans * 3
+
+    # i to j is one span going around, a tooth goes from a to b and the gap after it from b to c
+    i, j = span, np.roll(span, -1)
+    a, b, c = span[::2], span[1::2], np.roll(span[::2], -1)
+
+    def quads(*corners):
+        return np.stack(corners, axis=1)
+
+    faces = [
+        # the caps, top then bottom, the ring between the hole and the base, then the top of each tooth
+        quads(baseTop[i], innerTop[i], innerTop[j], baseTop[j]),
+        quads(tipTop[a], baseTop[a], baseTop[b], tipTop[b]),
+        quads(baseBottom[j], innerBottom[j], innerBottom[i], baseBottom[i]),
+        quads(tipBottom[b], baseBottom[b], baseBottom[a], tipBottom[a]),
+        # the wall of the hole faces the middle
+        quads(innerTop[i], innerBottom[i], innerBottom[j], innerTop[j]),
+        # the outer walls in the order they go around: a side of the tooth, its end, its other side, then the gap
+        quads(tipTop[a], tipBottom[a], baseBottom[a], baseTop[a]),
+        quads(tipTop[b], tipBottom[b], tipBottom[a], tipTop[a]),
+        quads(baseTop[b], baseBottom[b], tipBottom[b], tipTop[b]),
+        quads(baseTop[c], baseBottom[c], baseBottom[b], baseTop[b]),
+    ]
+
+    connects = np.concatenate(faces).ravel().astype(np.int32)
+    counts = np.full(len(connects) // 4, 4, dtype=np.int32)
+
+    return points, counts, connects
+
+
+class GearMesh(object):
+    """
+    This is a gear made with a single MFnMesh.create instead of a polyPipe and an extrude,
+    so it has no history to evaluate again on every edit.
+    """
+
+    def __init__(self):
+        self.transform = None
+        self.shape = None
+        self.teeth = None
+
+    def createGear(self, teeth=10, length=5, radius=1.0, thickness=0.5, height=2.0):
+        points, counts, connects = gearArrays(teeth, length, radius, thickness, height)
+
+        transform = om.MFnMesh().create(om.MPointArray(points.tolist()), counts.tolist(), connects.tolist())
+        self._keep(transform, teeth)
+
+        # a mesh made through the API has no material yet, it would show up green in the viewport
+        cmds.sets(self.shape, edit=True, forceElement='initialShadingGroup')
+
+        return self.transform, self.shape
+
+    def modifyTeeth(self, teeth=20, length=10, radius=1.0, thickness=0.5, height=2.0):
+        points, counts, connects = gearArrays(teeth, length, radius, thickness, height)
+
+        if teeth == self.teeth:
+            # the faces are the same, only the points moved
+            om.MFnMesh(self._path(self.shape)).setPoints(om.MPointArray(points.tolist()))
+            return None
+
+        # a new number of teeth is a new set of faces, so the shape is made again under the same transform
+        cmds.delete(self.shape)
+        transform = self._path(self.transform).node()
+        om.MFnMesh().create(om.MPointArray(points.tolist()), counts.tolist(), connects.tolist(), parent=transform)
+        self._keep(transform, teeth)
+
+        cmds.sets(self.shape, edit=True, forceElement='initialShadingGroup')
+
+        return None
+
+    def _keep(self, transform, teeth):
+        path = om.MDagPath.getAPathTo(transform)
+        self.transform = path.fullPathName()
+        self.shape = path.extendToShape().fullPathName()
+        self.teeth = teeth
+
+    def _path(self, name):
+        selection = om.MSelectionList()
+        selection.add(name)
+        return selection.getDagPath(0)
+
+
+def toothTable(teeth, pressureAngle=20.0, lods=LODS):
+    """
+    This function will work out the polar points of one tooth for every level of detail, for a module of 1.
+    The tooth sides are involutes of the base circle, the tip and the root are arcs.
+    Args:
+        teeth: the num of teeth
+        pressureAngle: the pressure angle in degrees, 20 is the usual one
+        lods: the levels of detail, like LODS
+
+    Returns:
+        {lod name: (radii, angles, inner angles)}, angles are around the middle of the tooth at angle 0
+    """
+    key = (teeth, pressureAngle, lods)
+    if key in _PROFILES:
+        return _PROFILES[key]
+
+    alpha = np.radians(pressureAngle)
+    pitch = teeth / 2.0
+    base = pitch * np.cos(alpha)
+    tip = pitch + 1.0
+    root = pitch - 1.25
+
+    # half of the tooth seen from the middle, at the pitch circle, then along the involute
+    half = np.pi / (2 * teeth) + np.tan(alpha) - alpha
+    step = 2 * np.pi / teeth
+
+    tables = {}
+    for name, flankPoints, tipPoints, rootPoints, distance in lods:
+        # the involute starts at the base circle, below it the side of the tooth is a straight line to the root
+        start = np.sqrt(max((max(root, base) / base) ** 2 - 1, 0))
+        end = np.sqrt((tip / base) ** 2 - 1)
+        t = np.linspace(start, end, flankPoints + 1)
+
+        flankRadii = base * np.sqrt(1 + t * t)
+        flankAngles = half - (t - np.arctan(t))
+
+        if root < base:
+            flankRadii = np.concatenate([[root], flankRadii])
+            flankAngles = np.concatenate([[flankAngles[0]], flankAngles])
+
+        tipAngles = np.linspace(-flankAngles[-1], flankAngles[-1], tipPoints + 2)[1:-1]
+        rootAngles = np.linspace(flankAngles[0], step - flankAngles[0], rootPoints + 2)[1:-1]
+
+        # going around: up the first side, over the tip, down the other side, then along the root to the next tooth
+        radii = np.concatenate([flankRadii, np.full(tipPoints, tip), flankRadii[::-1], np.full(rootPoints, root)])
+        angles = np.concatenate([-flankAngles, tipAngles, flankAngles[::-1], rootAngles])
+
+        # the hole gets as many points, evenly spaced, so no two of them share an angle like the straight sides do
+        innerAngles = angles[0] + step * np.arange(len(angles)) / len(angles)
+
+        tables[name] = (radii, angles, innerAngles)
+
+    _PROFILES[key] = tables
+    return tables
+
+
+def ringFaces(count):
+    """
+    This function will get the faces of a closed ring between two profiles of count points.
+    They only depend on count, so they are worked out once and shared by every ring with as many points.
+    Args:
+        count: the num of points of each profile
+
+    Returns:
+        (counts, connects) like gearArrays()
+    """
+    if count in _RINGS:
+        return _RINGS[count]
+
+    # each cap has the outer points then the inner ones, the bottom cap starts after the top one
+    span = np.arange(count)
+    outerTop, innerTop = span, span + count
+    outerBottom, innerBottom = outerTop + count * 2, innerTop + count * 2
+    i, j = span, np.roll(span, -1)
+
+    def quads(*corners):
+        return np.stack(corners, axis=1)
+
+    faces = [
+        quads(outerTop[i], innerTop[i], innerTop[j], outerTop[j]),
+        quads(outerBottom[j], innerBottom[j], innerBottom[i], outerBottom[i]),
+        quads(innerTop[i], innerBottom[i], innerBottom[j], innerTop[j]),
+        quads(outerTop[j], outerBottom[j], outerBottom[i], outerTop[i]),
+    ]
+
+    connects = np.concatenate(faces).ravel().astype(np.int32)
+    counts = np.full(count * 4, 4, dtype=np.int32)
+
+    _RINGS[count] = (counts, connects)
+    return counts, connects
+
+
+def ringArrays(outer, inner, height=2.0):
+    """
+    This function will make a closed ring mesh between an outer and an inner profile with the same num of points.
+    Args:
+        outer: (x, z) arrays of the outer profile, going around counterclockwise from above
+        inner: (x, z) arrays of the hole
+        height: the height of the ring along Y
+
+    Returns:
+        (points, counts, connects) like gearArrays()
+    """
+    count = len(outer[0])
+
+    points = np.empty((count * 4, 3))
+    points[:, 0] = np.tile(np.concatenate([outer[0], inner[0]]), 2)
+    points[:, 2] = np.tile(np.concatenate([outer[1], inner[1]]), 2)
+    points[:count * 2, 1] = height / 2.0
+    points[count * 2:, 1] = -height / 2.0
+
+    counts, connects = ringFaces(count)
+
+    return points, counts, connects
+
+
+def involuteArrays(teeth=20, module=0.1, thickness=0.25, height=0.5, pressureAngle=20.0, lods=LODS):
+    """
+    This function will work out the mesh of every level of detail of an involute gear in one go.
+    The cos and sin of where each tooth sits are worked out once and shared by all the levels,
+    each level only adds the angles inside one tooth to them.
+    Args:
+        teeth: the num of teeth
+        module: the size of the teeth, the pitch diameter is teeth * module
+        thickness: the distance from the root of the teeth to the hole in the middle
+        height: the height of the gear along Y
+        pressureAngle: the pressure angle in degrees
+        lods: the levels of detail, like LODS
+
+    Returns:
+        {lod name: (points, counts, connects)}
+    """
+    hole = module * (teeth / 2.0 - 1.25) - thickness
+    if hole <= 0:
+        raise ValueError("The gear is too thick, there is no room for the hole.")
+
+    # the trig table of the teeth, shared by every level of detail
+    turns = 2 * np.pi * np.arange(teeth) / teeth
+    turnCos, turnSin = np.cos(turns)[:, None], np.sin(turns)[:, None]
+
+    meshes = {}
+    for name, (radii, angles, innerAngles) in toothTable(teeth, pressureAngle, lods).items():
+        # cos(a + b) and sin(a + b) from the two tables, for every point of every tooth at once
+        cos, sin = np.cos(angles), np.sin(angles)
+        x = (turnCos * cos - turnSin * sin) * radii * module
+        z = (turnSin * cos + turnCos * sin) * radii * module
+
+        cos, sin = np.cos(innerAngles), np.sin(innerAngles)
+        innerX = (turnCos * cos - turnSin * sin) * hole
+        innerZ = (turnSin * cos + turnCos * sin) * hole
+
+        meshes[name] = ringArrays((x.ravel(), z.ravel()), (innerX.ravel(), innerZ.ravel()), height)
+
+    return meshes
+
+
+class InvoluteGear(object):
+    """
+    This is a gear with real involute teeth. Every level of detail is a mesh under one lodGroup,
+    which shows the one that fits how far the camera is, or the one we pick with setLod().
+    """
+
+    def __init__(self):
+        self.transform = None
+        self.levels = []
+
+    def createGear(self, teeth=20, module=0.1, thickness=0.25, height=0.5, pressureAngle=20.0, camera='persp',
+                   lods=LODS):
+        meshes = involuteArrays(teeth, module, thickness, height, pressureAngle, lods)
+
+        # a lodGroup is a transform which turns the visibility of its children on and off
+        self.transform = cmds.createNode('lodGroup', name='involuteGear#')
+        cmds.connectAttr('%s.worldMatrix[0]' % camera, '%s.cameraMatrix' % self.transform)
+
+        outer = module * (teeth / 2.0 + 1.0)
+        self.levels = []
+
+        for index, (name, flankPoints, tipPoints, rootPoints, distance) in enumerate(lods):
+            points, counts, connects = meshes[name]
+            mesh = om.MFnMesh().create(om.MPointArray(points.tolist()), counts.tolist(), connects.tolist())
+            level = cmds.parent(om.MDagPath.getAPathTo(mesh).fullPathName(), self.transform)[0]
+            level = cmds.rename(level, '%s_%s' % (self.transform, name))
+
+            cmds.sets(level, edit=True, forceElement='initialShadingGroup')
+            cmds.connectAttr('%s.output[%s]' % (self.transform, index), '%s.lodVisibility' % level)
+
+            # the last level has no threshold, it is shown whenever the camera is farther than all of them
+            if distance is not None:
+                cmds.setAttr('%s.threshold[%s]' % (self.transform, index), distance * outer)
+
+            self.levels.append(level)
+
+        return self.transform, self.levels
+
+    def setLod(self, name=None):
+        """
+        Show only one level of detail, whatever the camera does
+        Args:
+            name: one of the LODS names. Default to go back to picking it from the camera distance
+
+        Returns:
+            None
+        """
+        for index, level in enumerate(self.levels):
+            # displayLevel is 0 to use the distance, 1 to always show and 2 to always hide
+            if name is None:
+                display = 0
+            elif level.endswith('_%s' % name):
+                display = 1
+            else:
+                display = 2
+
+            cmds.setAttr('%s.displayLevel[%s]' % (self.transform, index), display)
+
+        return None